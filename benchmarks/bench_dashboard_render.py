@@ -0,0 +1,74 @@
+"""Dashboard `/`: Latenz (p50/p99) über die echte Route mit angemeldeter Session.
+
+Gemessen werden drei Fälle über app.test_client():
+  kalt         - vorkompiliertes Template, Seite wird gerendert (200)
+  If-None-Match - Browser schickt das ETag mit, Antwort ist 304 ohne Rendern
+  pro Request  - Verhalten vor dem Umbau: Template wird bei jedem Request kompiliert
+
+Aufruf aus dem Repo-Verzeichnis: python benchmarks/bench_dashboard_render.py [Requests]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main lädt bot_data aus dem Arbeitsverzeichnis - die echten Daten bleiben unberührt
+os.chdir(tempfile.mkdtemp())
+
+import web  # noqa: E402
+
+
+class PerRequestTemplate:
+    """Kompiliert das Dashboard bei jedem render() neu (wie render_template_string)."""
+
+    def render(self, **context):
+        return web.app.jinja_env.from_string(web.HTML_TEMPLATE).render(**context)
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def measure(client, requests, expected, headers=None):
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get('/', headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == expected, response.status_code
+    return samples
+
+
+def run(requests=500):
+    client = web.app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'id': '1', 'username': 'bench', 'avatar': None}
+        session['user_role'] = 'ausbilderleitung'
+        session['guild_id'] = str(web.Config.GUILD_ID or 1)
+        session['role_version'] = web.role_versions.get('1')
+        session['roles_checked_at'] = time.time()
+
+    first = client.get('/')
+    assert first.status_code == 200, first.status_code
+    etag = first.headers['ETag']
+
+    results = {
+        'kalt': measure(client, requests, 200),
+        'If-None-Match': measure(client, requests, 304, {'If-None-Match': etag}),
+    }
+    precompiled = web.DASHBOARD_TEMPLATE
+    web.DASHBOARD_TEMPLATE = PerRequestTemplate()
+    try:
+        results['pro Request'] = measure(client, requests, 200)
+    finally:
+        web.DASHBOARD_TEMPLATE = precompiled
+
+    print(f"{'GET /':>16}  {'p50 ms':>8}  {'p99 ms':>8}")
+    for name, samples in results.items():
+        print(f"{name:>16}  {percentile(samples, 50):8.3f}  {percentile(samples, 99):8.3f}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
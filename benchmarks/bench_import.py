@@ -0,0 +1,62 @@
+"""Massenimport: 10.000 CSV-Zeilen streamen und benoten (iter_import_rows + grade_entries).
+
+Zum Vergleich die zeilenweise Variante mit einem Notenaufruf pro Teilnehmer.
+Aufruf aus dem Repo-Verzeichnis: python benchmarks/bench_import.py [Zeilen]
+"""
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main lädt bot_data aus dem Arbeitsverzeichnis - die echten Daten bleiben unberührt
+os.chdir(tempfile.mkdtemp())
+
+import main  # noqa: E402
+
+
+def make_csv(rows):
+    lines = ['user_id,points'] + [f"{100000000000000000 + i},{i % 51}" for i in range(rows)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def streamed(payload):
+    return main.grade_entries('theorie', main.iter_import_rows(io.BytesIO(payload), 'import.csv'))
+
+
+def per_row(payload):
+    entries = []
+    for row in list(csv.DictReader(io.StringIO(payload.decode('utf-8')))):
+        points = int(row['points'])
+        grade = main.get_grade_from_points(points, 'theorie')
+        entries.append({'user_id': int(row['user_id']), 'points': points, 'grade': grade, 'passed': grade <= 4})
+    return entries, []
+
+
+def measure(func, payload):
+    tracemalloc.start()
+    started = time.perf_counter()
+    entries, errors = func(payload)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return entries, errors, elapsed, peak
+
+
+def run(rows=10_000):
+    payload = make_csv(rows)
+    results = {}
+    for name, func in (('grade_entries (Stream)', streamed), ('zeilenweise', per_row)):
+        func(payload)  # Aufwärmen (Notenspiegel-Cache)
+        entries, errors, elapsed, peak = measure(func, payload)
+        assert len(entries) == rows and not errors
+        results[name] = entries
+        print(f"{name:>24}: {elapsed * 1000:8.1f} ms, Spitze {peak / 1024:8.0f} KiB, {rows / elapsed:10.0f} Zeilen/s")
+    assert results['grade_entries (Stream)'] == results['zeilenweise']
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -1,15 +1,8 @@
-from flask import Flask
 from threading import Thread
 
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "Custom Moderation läuft!"
-
-def run():
-    app.run(host='0.0.0.0', port=5000)
-
+# Der Health-Endpoint liegt jetzt als /health in der Dashboard-App (web.py),
+# damit nur noch ein Listener läuft.
 def keep_alive():
-    t = Thread(target=run)
+    from web import run_flask
+    t = Thread(target=run_flask, daemon=True)
     t.start()
@@ -1,16 +1,40 @@
+import time
+STARTUP_STARTED = time.perf_counter()
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 import json
+import re
+import csv
+import io
 import os
 from datetime import datetime
 from typing import Literal
-from flask import Flask, render_template_string, request, jsonify, redirect, session, url_for
-from threading import Thread
+import sys
+import threading
+from threading import Thread, Lock, Event
 import secrets
-import requests
-from urllib.parse import urlencode
+import random
+import hashlib
+import aiohttp
 import asyncio
+import atexit
+import signal
+from collections import OrderedDict, defaultdict, deque, Counter
+from bisect import bisect_left, bisect_right, insort
+import heapq
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+import math
+import concurrent.futures
+import functools
+import traceback
+
+# web.py importiert dieses Modul als `main` - beim Start als Skript nicht doppelt laden
+sys.modules.setdefault('main', sys.modules[__name__])
 
 # ==================== KONFIGURATION ====================
 class Config:
@@ -23,8 +47,14 @@ class Config:
     REDIRECT_URI = os.getenv('REDIRECT_URI', 'http://localhost:5000/callback')
     GUILD_ID = os.getenv('GUILD_ID')  # WICHTIG: Deine Server-ID hier eintragen!
     OAUTH2_URL = 'https://discord.com/api/oauth2/authorize'
-    TOKEN_URL = 'https://discord.com/api/oauth2/token'
-    API_ENDPOINT = 'https://discord.com/api/v10'
+    TOKEN_URL = os.getenv('DISCORD_TOKEN_URL', 'https://discord.com/api/oauth2/token')
+    API_ENDPOINT = os.getenv('DISCORD_API_ENDPOINT', 'https://discord.com/api/v10')
+
+    # HTTP-Client (Timeouts in Sekunden)
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+    HTTP_RETRY_BUDGET = float(os.getenv('HTTP_RETRY_BUDGET', 10))  # Gesamtwartezeit aller Wiederholungen
 
     # Rollen für Berechtigungen
     AUSBILDERLEITUNG_ROLES = ['1461433250865086772', '1461486247447892141']
@@ -44,32 +74,454 @@ class Config:
 
     REACTION_EMOJI = '<:Dokument:1461765293847347262>'
 
+    # Dashboard starten? Ohne Webserver werden Flask/Jinja gar nicht erst geladen
+    WEB_ENABLED = os.getenv('WEB_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+    # Prozessrolle: 'all' (Bot + Portal), 'bot' oder 'web' (getrennt über den Job-Bus)
+    PROCESS_ROLE = os.getenv('PROCESS_ROLE', 'all')
+    JOB_BUS_URL = os.getenv('JOB_BUS_URL', 'sqlite:///bot_bus.sqlite3')
+    # Nur PROCESS_ROLE=web: ohne Gateway werden Portal-Rollen alle n Sekunden per REST nachgeprüft
+    ROLE_RECHECK_INTERVAL = float(os.getenv('ROLE_RECHECK_INTERVAL', 60))
+    # Nur PROCESS_ROLE=bot: eigener /metrics-Listener, da dort kein Flask läuft
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+
+    # Opt-in: Watchdog für Event-Loop-Hänger und Stichproben-Profil langsamer Handler
+    LOOP_WATCHDOG = os.getenv('LOOP_WATCHDOG', 'false').lower() in ('1', 'true', 'yes')
+    LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', 0.5))  # Sekunden
+    SLOW_HANDLER_THRESHOLD = float(os.getenv('SLOW_HANDLER_THRESHOLD', 1.0))  # Sekunden
+    PROFILE_FILE = os.getenv('PROFILE_FILE', 'bot_profile.txt')
+    # Discord verwirft Interaktionen, die nicht innerhalb von 3 Sekunden bestätigt werden (Warnschwelle)
+    INTERACTION_ACK_DEADLINE = float(os.getenv('INTERACTION_ACK_DEADLINE', 3.0))
+
+    # Logausgabe: 'json' (eine JSON-Zeile pro Ereignis) oder 'text' (nur die Meldung)
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+
+    # Slash-Commands auch bei unverändertem Hash synchronisieren
+    FORCE_SYNC = os.getenv('FORCE_SYNC', 'false').lower() in ('1', 'true', 'yes')
+
+    # Webserver: 'waitress' (Produktion) oder 'dev' (Flask-Entwicklungsserver)
+    WEB_SERVER = os.getenv('WEB_SERVER', 'waitress')
+    WEB_THREADS = int(os.getenv('WEB_THREADS', 8))
+    # Gleichzeitige Requests; unter waitress höchstens WEB_THREADS - 1, damit ein Thread für /health und /metrics frei bleibt
+    WEB_MAX_CONCURRENT = int(os.getenv('WEB_MAX_CONCURRENT', max(1, WEB_THREADS - 1)))
+    WEB_QUEUE_TIMEOUT = float(os.getenv('WEB_QUEUE_TIMEOUT', 5))  # Sekunden bis 503
+    WEB_CONNECTION_LIMIT = int(os.getenv('WEB_CONNECTION_LIMIT', 100))  # offene Verbindungen (waitress)
+    WEB_BACKLOG = int(os.getenv('WEB_BACKLOG', 64))  # wartende Verbindungen im Kernel (waitress)
+
     BANNERS = {
         'theorie': 'https://media.discordapp.net/attachments/1461429300241895579/1461748446636675308/image.png',
         'grund': 'https://media.discordapp.net/attachments/1461429300241895579/1461748584343928975/image.png',
         'stvo': 'https://media.discordapp.net/attachments/1461429300241895579/1461748684269031486/image.png'
     }
 
+# ==================== METRIKEN & LOGGING ====================
+def log(event, msg, level='info', **fields):
+    """Strukturiertes Log: eine JSON-Zeile mit Zeit, Level, Ereignis, Meldung und Feldern."""
+    if Config.LOG_FORMAT == 'text':
+        print(msg, flush=True)
+        return
+    record = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'level': level, 'event': event, 'msg': msg, **fields}
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+class Metrics:
+    """Zähler, Histogramme und Gauges für /metrics (Prometheus-Textformat).
+
+    Schlüssel ist (Name, Labels); Histogramme zählen kumulativ pro Bucket.
+    Gauges sind Funktionen, die erst beim Abruf ausgewertet werden.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = Lock()
+        self._meta = {}
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._gauges = {}
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            position = bisect_left(self.BUCKETS, seconds)
+            if position < len(self.BUCKETS):
+                entry[0][position] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Misst die Dauer des Blocks; funktioniert auch um `await` herum."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge(self, name, help_text, fn):
+        self.describe(name, 'gauge', help_text)
+        self._gauges[name] = fn
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = [*labels, *extra]
+        if not pairs:
+            return ''
+        # json.dumps liefert die Escapes, die das Textformat erwartet (\\, \", \n)
+        return '{' + ','.join(f'{k}={json.dumps(str(v), ensure_ascii=False)}' for k, v in pairs) + '}'
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._histograms.items()}
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {self._meta.get(name, (kind, name))[1]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS, buckets):
+                cumulative += n
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        for name, fn in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            header(name, 'gauge')
+            lines.append(f"{name} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.describe('bot_save_seconds', 'histogram', 'Dauer von save_data (Journal/Snapshot)')
+metrics.describe('bot_role_assignment_seconds', 'histogram', 'Dauer einer Rollenvergabe (member.edit)')
+metrics.describe('bot_channel_send_seconds', 'histogram', 'Dauer von channel.send nach Nachrichtenart')
+metrics.describe('bot_event_loop_lag_seconds', 'histogram', 'Verzögerung des Event-Loops gegenüber dem geplanten Aufwachen')
+metrics.describe('web_oauth_seconds', 'histogram', 'Dauer der OAuth-Schritte im Login-Callback')
+metrics.describe('web_request_seconds', 'histogram', 'Dauer der Web-Requests nach Endpoint')
+metrics.describe('bot_jobs_total', 'counter', 'Abgearbeitete Jobs nach Art und Ergebnis')
+metrics.describe('bot_role_updates_total', 'counter', 'Rollenvergaben nach Ergebnis')
+
+# ==================== STARTZEIT ====================
+class StartupTimer:
+    """Misst die Startphasen (Import, Daten, Web, Gateway, Sync) für den Startbericht."""
+
+    def __init__(self, started):
+        self._last = started
+        self.phases = {}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def report(self):
+        total = sum(self.phases.values())
+        log('startup', "⏱️ Start: " + " · ".join(f"{phase} {ms:.0f} ms" for phase, ms in self.phases.items()) + f" · gesamt {total:.0f} ms", phases=self.phases, total_ms=round(total, 1))
+
+startup = StartupTimer(STARTUP_STARTED)
+startup.mark('import')
+
 DATA_FILE = 'bot_data.json'
+JOURNAL_FILE = DATA_FILE + '.journal'
+SNAPSHOT_EVERY = int(os.getenv('SNAPSHOT_EVERY', 500))  # Journal-Einträge bis zur Kompaktierung
+SAVE_INTERVAL = float(os.getenv('SAVE_INTERVAL', 2.0))  # Sekunden zwischen zwei Schreibvorgängen
+
+class JournalStore:
+    """Persistenz aus kompaktem Snapshot (DATA_FILE) und append-only Journal.
+
+    `save()` schreibt nur die Änderungen seit dem letzten Aufruf ins Journal:
+    Listen gelten als append-only, Dicts werden pro Schlüssel verglichen
+    (neue, ersetzte oder entfernte Einträge). Einträge werden ersetzt, nie
+    in-place verändert - deshalb genügt dem Writer-Thread eine flache Kopie
+    der Container.
+    Nach SNAPSHOT_EVERY Journal-Einträgen wird ein Snapshot atomar
+    (Temp-Datei, fsync, rename) geschrieben und das Journal geleert.
+    Eine bestehende bot_data.json ohne Journal wird direkt als Snapshot
+    der Generation 0 übernommen.
+
+    Mit `readonly` (Web-Prozess) wird nur gelesen: keine Reparatur, kein
+    Abschneiden, kein Schreiben - die Dateien gehören dem Bot-Prozess.
+    """
+
+    def __init__(self, path, journal_path, snapshot_every=SNAPSHOT_EVERY, readonly=False):
+        # Absolut: ein späteres chdir (z.B. durch einen Test-Runner) darf das Ziel nicht verschieben
+        self.path = os.path.abspath(path)
+        self.journal_path = os.path.abspath(journal_path)
+        self.snapshot_every = snapshot_every
+        self.readonly = readonly
+        self._lock = Lock()
+        self._write_lock = Lock()
+        self._seen = {}
+        self._generation = 0
+        self._journal_records = 0
+
+    # ---------- Laden ----------
+    def load(self):
+        with self._lock:
+            data = self._read_snapshot()
+            self._generation = data.pop('_journal', 0)
+            self._remember(data)
+            self._journal_records = self._replay(data)
+            if self._journal_records and not self.readonly:
+                log('journal_replayed', f"📒 Journal: {self._journal_records} Änderungen wiederhergestellt", records=self._journal_records)
+            return data
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            if self.readonly:
+                log('snapshot_unreadable', f"⚠️ {self.path} nicht lesbar ({e})", level='warning', path=self.path)
+                return {}
+            corrupt = f'{self.path}.corrupt-{int(time.time())}'
+            os.replace(self.path, corrupt)
+            log('snapshot_corrupt', f"❌ {self.path} beschädigt ({e}), gesichert als {corrupt}", level='error', path=self.path, backup=corrupt)
+            return {}
+
+    def _replay(self, data):
+        if not os.path.exists(self.journal_path):
+            return 0
+        count = 0
+        good_offset = 0
+        torn = False
+        with open(self.journal_path, 'rb') as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('unvollständige Zeile')
+                    record = json.loads(line)
+                except ValueError:
+                    # Abgebrochener (oder im Web-Prozess: noch laufender) Schreibvorgang - Rest verwerfen
+                    torn = not self.readonly
+                    if torn:
+                        log('journal_torn', f"⚠️ Journal ab Zeile {line_no} unvollständig, wird abgeschnitten", level='warning', line=line_no)
+                    break
+                good_offset += len(line)
+                if record[0] == 'gen':
+                    if record[1] != self._generation:
+                        # Journal gehört zu einem älteren Snapshot und ist bereits enthalten
+                        if not self.readonly:
+                            os.remove(self.journal_path)
+                        return 0
+                    continue
+                self._apply(data, record)
+                count += 1
+        if torn:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_offset)
+                os.fsync(f.fileno())
+        return count
+
+    def _apply(self, data, record):
+        op, key = record[0], record[1]
+        if op == 'append':
+            data.setdefault(key, []).append(record[2])
+            self._seen[key] = (data[key], len(data[key]))
+        elif op == 'put':
+            data.setdefault(key, {})[record[2]] = record[3]
+            self._seen[key] = (data[key], dict(data[key]))
+        elif op == 'del':
+            data.get(key, {}).pop(record[2], None)
+            self._seen[key] = (data[key], dict(data[key]))
+        elif op == 'set':
+            data[key] = record[2]
+            self._remember_key(key, record[2])
+        elif op == 'drop':
+            data.pop(key, None)
+            self._seen.pop(key, None)
+
+    def _remember(self, data):
+        self._seen = {}
+        for key, value in data.items():
+            self._remember_key(key, value)
+
+    def _remember_key(self, key, value):
+        self._seen[key] = self._fingerprint(value)
+
+    @staticmethod
+    def _fingerprint(value):
+        if isinstance(value, list):
+            return (value, len(value))
+        if isinstance(value, dict):
+            return (value, dict(value))
+        return (value, json.dumps(value))
+
+    # ---------- Schreiben ----------
+    @staticmethod
+    def _shallow(value):
+        if isinstance(value, list):
+            return list(value)
+        if isinstance(value, dict):
+            return dict(value)
+        return value
+
+    def _diff(self, data):
+        """Änderungen seit dem letzten erfolgreichen Schreiben.
+
+        Arbeitet auf einer Kopie von `_seen` und gibt sie mit zurück - übernommen
+        wird sie erst, wenn die Records auf der Platte sind.
+        """
+        records = []
+        seen_after = dict(self._seen)
+        for key, value in list(data.items()):
+            seen = seen_after.get(key)
+            if seen is None or seen[0] is not value:
+                records.append(['set', key, self._shallow(value)])
+                seen_after[key] = self._fingerprint(value)
+                continue
+            if isinstance(value, list):
+                length = len(value)
+                if length < seen[1]:
+                    records.append(['set', key, self._shallow(value)])
+                else:
+                    records.extend(['append', key, item] for item in value[seen[1]:length])
+                seen_after[key] = (value, length)
+            elif isinstance(value, dict):
+                current = dict(value)
+                old = seen[1]
+                for k, v in current.items():
+                    if old.get(k) is not v:
+                        records.append(['put', key, k, v])
+                for k in old.keys() - current.keys():
+                    records.append(['del', key, k])
+                seen_after[key] = (value, current)
+            else:
+                dumped = json.dumps(value)
+                if dumped != seen[1]:
+                    records.append(['set', key, value])
+                    seen_after[key] = (value, dumped)
+        for key in list(seen_after):
+            if key not in data:
+                records.append(['drop', key])
+                del seen_after[key]
+        return records, seen_after
+
+    def save(self, data, snapshot=False, capture=None):
+        """Schreibt die Änderungen ins Journal bzw. `snapshot=True` sofort einen Snapshot.
+
+        `capture(func, *args)` führt das Erfassen der Änderungen dort aus, wo
+        bot_data verändert wird (siehe DataPersister.call); geschrieben wird
+        im aufrufenden Thread. Schlägt das Schreiben fehl, bleibt der
+        Vergleichsstand unverändert: der nächste Aufruf schreibt dieselben
+        Änderungen erneut.
+        """
+        if self.readonly:
+            return
+        with self._write_lock:
+            batch = (capture or (lambda func, *args: func(*args)))(self._prepare, data, snapshot)
+            if batch['snapshot']:
+                self._write_snapshot(batch['payload'])
+            elif batch['payload']:
+                self._append(batch['payload'])
+            self._seen = batch['seen']
+
+    def _prepare(self, data, snapshot):
+        # Nur flache Kopien der Container: Einträge werden ersetzt statt verändert,
+        # das Serialisieren übernimmt der Writer-Thread
+        records, seen = self._diff(data)
+        snapshot = snapshot or self._journal_records + len(records) >= self.snapshot_every
+        if snapshot:
+            payload = {key: self._shallow(value) for key, value in data.items()}
+        else:
+            payload = records
+        return {'seen': seen, 'snapshot': snapshot, 'payload': payload}
+
+    def _append(self, records):
+        # Vor dem Öffnen serialisieren: ein Fehler dabei hinterlässt nichts im Journal
+        payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8')
+        new_journal = not os.path.exists(self.journal_path)
+        with open(self.journal_path, 'ab') as f:
+            if new_journal:
+                f.write((json.dumps(['gen', self._generation]) + '\n').encode('utf-8'))
+            offset = f.tell()
+            try:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # Halb geschriebene Zeilen entfernen, sonst verdecken sie beim Replay alle späteren
+                try:
+                    f.truncate(offset)
+                except OSError:
+                    pass
+                raise
+        self._journal_records += len(records)
+
+    def _write_snapshot(self, data):
+        generation = self._generation + 1
+        snapshot = dict(data)
+        snapshot['_journal'] = generation
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        _fsync_dir(self.path)
+        # Ab hier ist das alte Journal (Generation != Snapshot) wirkungslos
+        self._generation = generation
+        self._journal_records = 0
+        try:
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(['gen', generation]) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            # Der Snapshot ist sicher; ins alte Journal darf aber nicht weitergeschrieben
+            # werden (falsche Generation) - der nächste save() schreibt wieder einen Snapshot
+            self._journal_records = self.snapshot_every
+            log('journal_reset_failed', f"⚠️ Journal nicht zurückgesetzt: {e}", level='warning', error=str(e))
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+store = JournalStore(DATA_FILE, JOURNAL_FILE, readonly=Config.PROCESS_ROLE == 'web')
 
 def load_data():
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'templates' not in data:
-                    data['templates'] = get_default_templates()
-                if 'messages' not in data:
-                    data['messages'] = {}
-                return data
-        except:
-            pass
-    return {
-        'announcements': [], 
-        'evaluations': [],
-        'templates': get_default_templates(),
-        'messages': {}
-    }
+    data = store.load()
+    data.setdefault('announcements', [])
+    data.setdefault('evaluations', [])
+    if 'templates' not in data:
+        data['templates'] = get_default_templates()
+    if 'messages' not in data:
+        data['messages'] = {}
+    return data
 
 def get_default_templates():
     return {
@@ -99,397 +551,1176 @@ def get_default_templates():
         }
     }
 
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def save_data(data, capture=None):
+    store.save(data, capture=capture)
 
 bot_data = load_data()
-active_evaluations = {}
-
-# OAuth2 Helper Funktionen
-def get_user_info(access_token):
-    headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get(f'{Config.API_ENDPOINT}/users/@me', headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    return None
-
-def get_guild_member(guild_id, user_id, bot_token):
-    headers = {'Authorization': f'Bot {bot_token}'}
-    response = requests.get(f'{Config.API_ENDPOINT}/guilds/{guild_id}/members/{user_id}', headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    return None
-
-def check_user_roles(user_id, guild_id):
-    member = get_guild_member(guild_id, user_id, Config.TOKEN)
-    if not member:
-        return None
-
-    user_roles = member.get('roles', [])
+startup.mark('data')
+
+class DataPersister:
+    """Write-behind für bot_data.
+
+    Änderungen rufen nur `mark_dirty()` auf. Ein einzelner Writer-Thread
+    schreibt höchstens einmal pro `interval` Sekunden; alle Änderungen
+    dazwischen werden zu einem Schreibvorgang zusammengefasst. Ein
+    fehlgeschlagener Schreibvorgang wird mit Backoff wiederholt.
+
+    bot_data gehört dem Bot-Loop: Änderungen aus anderen Threads laufen über
+    `call()`, und auch der Writer erfasst seine Kopie dort. Ohne laufenden
+    Loop (Start, Shutdown, Web-Prozess) serialisiert stattdessen ein Lock.
+    """
+
+    CALL_TIMEOUT = 30.0
+
+    def __init__(self, data, interval=SAVE_INTERVAL):
+        self.data = data
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persister')
+        self._lock = Lock()
+        self._data_lock = threading.RLock()
+        self._loop = None
+        self._stop = Event()
+        self._scheduled = False
+        self._last_flush = 0.0
+        self._retry_at = 0.0
+        self._failures = 0
+        self.marks = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.last_flush_ms = 0.0
+
+    def mark_dirty(self):
+        """Markiert bot_data als geändert. Darf aus jedem Thread aufgerufen werden."""
+        with self._lock:
+            self.marks += 1
+            if self._scheduled:
+                self.coalesced += 1
+                return
+            self._scheduled = True
+        try:
+            self._executor.submit(self._run)
+        except RuntimeError:
+            # Executor bereits beendet (Shutdown) - direkt schreiben
+            self.flush()
+
+    def bind(self, loop):
+        """Ab jetzt werden Änderungen und Kopien im Bot-Loop ausgeführt."""
+        self._loop = loop
+
+    def call(self, func, *args, **kwargs):
+        """Führt `func` im Bot-Loop aus und wartet auf das Ergebnis. Darf aus jedem Thread aufgerufen werden."""
+        loop = self._loop
+        try:
+            in_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            return func(*args, **kwargs)
+        if loop is None or not loop.is_running():
+            with self._data_lock:
+                return func(*args, **kwargs)
+
+        future = concurrent.futures.Future()
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        loop.call_soon_threadsafe(run)
+        try:
+            return future.result(timeout=self.CALL_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            if future.cancel():
+                raise
+            # Läuft bereits - dann auch zu Ende abwarten
+            return future.result()
+
+    def _run(self):
+        wait = max(self._last_flush + self.interval, self._retry_at) - time.monotonic()
+        if wait > 0:
+            self._stop.wait(wait)
+        with self._lock:
+            self._scheduled = False
+        self._write()
+
+    def _write(self):
+        started = time.monotonic()
+        try:
+            with metrics.timer('bot_save_seconds'):
+                save_data(self.data, capture=self.call)
+        except Exception as e:
+            self._failures += 1
+            delay = min(60.0, self.interval * 2 ** self._failures)
+            self._retry_at = time.monotonic() + delay
+            log('save_failed', f"❌ Speichern fehlgeschlagen: {e} - neuer Versuch in {delay:.1f}s", level='error', error=str(e), attempt=self._failures, delay=delay)
+            if not self._stop.is_set():
+                self.mark_dirty()
+            return False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_flush = time.monotonic()
+        with self._lock:
+            self.flushes += 1
+            self.last_flush_ms = (self._last_flush - started) * 1000
+        return True
 
-    if any(role in Config.AUSBILDERLEITUNG_ROLES for role in user_roles):
-        return 'ausbilderleitung'
+    def flush(self):
+        """Schreibt ausstehende Änderungen sofort (blockierend); False, wenn das Schreiben fehlschlug."""
+        return self._write()
+
+    def close(self):
+        """Flush-on-exit: weckt einen wartenden Writer und beendet den Executor."""
+        self._stop.set()
+        self._executor.shutdown(wait=True)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'marks': self.marks,
+                'flushes': self.flushes,
+                'coalesced': self.coalesced,
+                'pending': self._scheduled,
+                'last_flush_ms': round(self.last_flush_ms, 3)
+            }
+
+persister = DataPersister(bot_data)
+atexit.register(persister.close)
+
+# ==================== GUILD-KONFIGURATION ====================
+class GuildConfigStore:
+    """Rollen, Kanäle, Team-Rollen und Templates pro Guild.
+
+    bot_data['guilds'] bildet Guild-ID -> {roles, channels, staff, templates}
+    ab. Fehlende Werte fallen auf Config bzw. die globalen Templates in
+    bot_data['templates'] zurück - eine bestehende Ein-Guild-Installation
+    läuft so ohne Migration weiter. Einträge werden ersetzt, nie in-place
+    geändert (Journal).
+    """
+
+    def __init__(self, data):
+        self.data = data
+        data.setdefault('guilds', {})
+
+    @property
+    def guilds(self):
+        return self.data['guilds']
+
+    def _entry(self, guild_id):
+        return self.guilds.get(str(guild_id), {}) if guild_id else {}
+
+    def is_configured(self, guild_id):
+        return str(guild_id) in self.guilds
+
+    def role_id(self, guild_id, typ, kind):
+        return self._entry(guild_id).get('roles', {}).get(typ, Config.ROLES[typ])[kind]
+
+    def channel_id(self, guild_id, typ, kind):
+        return self._entry(guild_id).get('channels', {}).get(typ, Config.CHANNELS[typ])[kind]
+
+    def staff_roles(self, guild_id):
+        """(Ausbilderleitung-Rollen, Ausbilder-Rollen) als Listen von ID-Strings."""
+        staff = self._entry(guild_id).get('staff', {})
+        return staff.get('ausbilderleitung', Config.AUSBILDERLEITUNG_ROLES), staff.get('ausbilder', Config.AUSBILDER_ROLES)
+
+    def templates(self, guild_id):
+        own = self._entry(guild_id).get('templates')
+        return {**self.data['templates'], **own} if own else self.data['templates']
+
+    def template(self, guild_id, typ):
+        return self.templates(guild_id).get(typ, {})
+
+    def set_template(self, guild_id, typ, template):
+        """Konfigurierte Guilds erhalten eigene Templates, sonst wird das globale geändert."""
+        if self.is_configured(guild_id):
+            entry = self._entry(guild_id)
+            self.guilds[str(guild_id)] = {**entry, 'templates': {**entry.get('templates', {}), typ: template}}
+        else:
+            self.data['templates'][typ] = template
+        persister.mark_dirty()
+
+    def configure(self, guild_id, typ=None, roles=None, channels=None, staff=None, name=None):
+        entry = dict(self._entry(guild_id))
+        if name:
+            entry['name'] = name
+        if typ and roles:
+            entry['roles'] = {**entry.get('roles', {}), typ: roles}
+        if typ and channels:
+            entry['channels'] = {**entry.get('channels', {}), typ: channels}
+        if staff:
+            entry['staff'] = {**entry.get('staff', {}), **staff}
+        self.guilds[str(guild_id)] = entry
+        persister.mark_dirty()
+
+guild_configs = GuildConfigStore(bot_data)
+
+# ==================== HISTORY-INDEX ====================
+def record_time(record):
+    """Unix-Zeit eines Eintrags: 'timestamp' oder ersatzweise 'created_at'."""
+    if record.get('timestamp') is not None:
+        return int(record['timestamp'])
+    try:
+        return int(datetime.fromisoformat(record['created_at']).timestamp())
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+def record_guild(record):
+    """Guild eines Eintrags als String; Altdaten ohne guild_id gehören zu Config.GUILD_ID.
+
+    Ist GUILD_ID nicht gesetzt, ordnet migrate_legacy_guild() sie beim Start zu.
+    """
+    guild_id = record.get('guild_id')
+    return str(guild_id) if guild_id else Config.GUILD_ID
+
+def record_host(record):
+    """Ausbilder eines Eintrags; ältere Auswertungen führen ihn als 'created_by'."""
+    return record.get('host', record.get('created_by'))
+
+def entry_passed(entry):
+    """Ältere Einträge haben kein 'passed' - dann gilt Note 1-4 als bestanden."""
+    if 'passed' in entry:
+        return entry['passed']
+    return entry.get('grade', 6) <= 4
+
+class RecordIndex:
+    """Indiziert eine append-only Liste nach Feldwerten und Zeit.
+
+    Jeder Feldindex bildet Wert -> aufsteigende Positionen ab; `times` ist
+    eine sortierte Liste (Zeit, Position). Abfragen starten beim kleinsten
+    Kandidaten-Set und prüfen die übrigen Filter direkt am Eintrag.
+    `derived` liefert für einzelne Felder eine Funktion statt record.get.
+    """
+
+    def __init__(self, records, fields, derived=None):
+        self.records = records
+        self.fields = fields
+        self.getters = {field: (derived or {}).get(field) or (lambda record, field=field: record.get(field)) for field in fields}
+        self.by = {field: defaultdict(list) for field in fields}
+        self.times = []
+        for pos, record in enumerate(records):
+            self._index(pos, record)
+
+    def _index(self, pos, record):
+        for field, getter in self.getters.items():
+            self.by[field][getter(record)].append(pos)
+        insort(self.times, (record_time(record), pos))
+
+    def add(self, record):
+        self.records.append(record)
+        self._index(len(self.records) - 1, record)
+
+    def query(self, since=None, until=None, **filters):
+        """Gibt passende Positionen zurück, neueste zuerst."""
+        filters = {f: v for f, v in filters.items() if v is not None}
+        candidates = [self.by[f].get(v, []) for f, v in filters.items()]
+
+        lo = bisect_left(self.times, (since,)) if since is not None else 0
+        hi = bisect_right(self.times, (until, float('inf'))) if until is not None else len(self.times)
+        use_range = since is not None or until is not None
+        if use_range and (not candidates or hi - lo < min(len(c) for c in candidates)):
+            result = sorted(pos for _, pos in self.times[lo:hi])
+            use_range = False  # Zeitfenster ist durch die Auswahl bereits erfüllt
+        elif candidates:
+            result = min(candidates, key=len)
+        else:
+            result = range(len(self.records))
+
+        records = self.records
+        checks = tuple((self.getters[field], value) for field, value in filters.items())
+        lower = since if since is not None else float('-inf')
+        upper = until if until is not None else float('inf')
+        positions = []
+        for pos in reversed(result):
+            record = records[pos]
+            for getter, value in checks:
+                if getter(record) != value:
+                    break
+            else:
+                if not use_range or lower <= record_time(record) <= upper:
+                    positions.append(pos)
+        return positions
+
+class HistoryIndex:
+    """Indizes über Ankündigungen, Auswertungen und einzelne Teilnehmer-Ergebnisse.
+
+    Die Indizes werden erst bei der ersten Abfrage aufgebaut; bis dahin
+    landen neue Einträge nur in bot_data.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._lock = Lock()
+        self._built = False
+
+    def reset(self):
+        """Verwirft die Indizes; sie werden bei der nächsten Abfrage neu aufgebaut."""
+        with self._lock:
+            self._built = False
+
+    def _build(self):
+        started = time.perf_counter()
+        derived = {'guild_id': record_guild, 'host': record_host}
+        self.announcements = RecordIndex(self.data['announcements'], ('guild_id', 'type', 'host'), derived)
+        self.evaluations = RecordIndex(self.data['evaluations'], ('guild_id', 'type', 'host'), derived)
+        self.results = RecordIndex([], ('guild_id', 'type', 'user_id', 'host', 'passed'))
+        for evaluation in self.data['evaluations']:
+            self._add_results(evaluation)
+        self._built = True
+        elapsed = (time.perf_counter() - started) * 1000
+        log('history_indexed', f"🗂️ Verlauf indiziert in {elapsed:.0f} ms", duration_ms=round(elapsed, 1))
+
+    def _add_results(self, evaluation):
+        for entry in evaluation.get('entries', []):
+            self.results.add({
+                'guild_id': record_guild(evaluation),
+                'type': evaluation.get('type'),
+                'user_id': entry.get('user_id'),
+                'host': record_host(evaluation),
+                'points': entry.get('points'),
+                'grade': entry.get('grade'),
+                'passed': entry_passed(entry),
+                'timestamp': record_time(evaluation)
+            })
+
+    def add_announcement(self, record):
+        with self._lock:
+            if self._built:
+                self.announcements.add(record)
+            else:
+                self.data['announcements'].append(record)
+        persister.mark_dirty()
+
+    def add_evaluation(self, record):
+        with self._lock:
+            if self._built:
+                self.evaluations.add(record)
+                self._add_results(record)
+            else:
+                self.data['evaluations'].append(record)
+        persister.mark_dirty()
+
+    def query(self, collection, page=1, per_page=50, **filters):
+        """Paginierte Abfrage; collection ist 'announcements', 'evaluations' oder 'results'."""
+        with self._lock:
+            if not self._built:
+                self._build()
+            index = getattr(self, collection)
+            positions = index.query(**filters)
+            start = (page - 1) * per_page
+            items = [index.records[pos] for pos in positions[start:start + per_page]]
+        return {'total': len(positions), 'page': page, 'per_page': per_page, 'items': items}
+
+history = HistoryIndex(bot_data)
+
+# ==================== AUSBILDUNGSFORTSCHRITT ====================
+STAGES = ('theorie', 'grund', 'stvo')
+STAGE_DONE = 'abgeschlossen'
+STAGE_NAMES = {'theorie': 'Theorie', 'grund': 'Grundausbildung', 'stvo': 'StVO', STAGE_DONE: 'Abgeschlossen'}
+
+def stage_index(stage):
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+class ProgressionLedger:
+    """Materialisierter Stand pro Azubi und Guild in bot_data['progression'] (Schlüssel: 'guild_id:user_id').
+
+    Ein Eintrag enthält die nächste offene Stufe, Versuche und Bestpunktzahl
+    pro Ausbildung sowie das letzte Ergebnis. Einträge werden bei jeder
+    Änderung ersetzt, damit der JournalStore sie als geändert erkennt.
+    Ein Ledger im alten Format (nur User-ID) wird aus der Historie neu aufgebaut.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        if 'progression' not in data or any(':' not in key for key in data['progression']):
+            data['progression'] = self.build(iter_evaluations(data))
+            if data['progression']:
+                log('progression_built', f"📈 Fortschritt aus Historie aufgebaut: {len(data['progression'])} Azubis", trainees=len(data['progression']))
+
+    @property
+    def entries(self):
+        return self.data['progression']
+
+    @staticmethod
+    def key(guild_id, user_id):
+        return f"{record_guild({'guild_id': guild_id})}:{user_id}"
+
+    def get(self, user_id, guild_id):
+        return self.entries.get(self.key(guild_id, user_id))
+
+    @staticmethod
+    def advance(record, training_type, entry, timestamp):
+        record = record or {'stage': STAGES[0], 'attempts': {}, 'best': {}, 'last': None}
+        attempts = dict(record['attempts'])
+        attempts[training_type] = attempts.get(training_type, 0) + 1
+        best = dict(record['best'])
+        if entry['points'] > best.get(training_type, -1):
+            best[training_type] = entry['points']
+        stage = record['stage']
+        passed = entry_passed(entry)
+        if passed and stage_index(training_type) >= stage_index(stage):
+            next_index = stage_index(training_type) + 1
+            stage = STAGES[next_index] if next_index < len(STAGES) else STAGE_DONE
+        return {
+            'stage': stage,
+            'attempts': attempts,
+            'best': best,
+            'last': {'type': training_type, 'points': entry['points'], 'grade': entry['grade'], 'passed': passed, 'timestamp': timestamp}
+        }
 
-    if any(role in Config.AUSBILDER_ROLES for role in user_roles):
-        return 'ausbilder'
+    def record_evaluation(self, evaluation):
+        timestamp = record_time(evaluation)
+        for entry in evaluation['entries']:
+            key = self.key(evaluation.get('guild_id'), entry['user_id'])
+            self.entries[key] = self.advance(self.entries.get(key), evaluation['type'], entry, timestamp)
+        persister.mark_dirty()
+
+    @classmethod
+    def build(cls, evaluations):
+        """Faltet einen Strom von Auswertungen zu einem neuen Ledger."""
+        ledger = {}
+        for evaluation in evaluations:
+            timestamp = record_time(evaluation)
+            for entry in evaluation.get('entries', []):
+                key = cls.key(evaluation.get('guild_id'), entry['user_id'])
+                ledger[key] = cls.advance(ledger.get(key), evaluation['type'], entry, timestamp)
+        return ledger
+
+    def rebuild(self):
+        """Baut das Ledger aus der Historie neu auf (Migration, /fortschritt_neu_aufbauen)."""
+        self.data['progression'] = self.build(iter_evaluations(self.data))
+        persister.mark_dirty()
+        return len(self.data['progression'])
+
+    def stage_counts(self, guild_id):
+        """Azubis einer Guild pro Stufe."""
+        prefix = self.key(guild_id, '')
+        counts = dict.fromkeys((*STAGES, STAGE_DONE), 0)
+        # Kopie: Flask-Threads zählen, während der Bot-Loop Einträge ersetzt
+        for key, record in list(self.entries.items()):
+            if key.startswith(prefix):
+                counts[record['stage']] = counts.get(record['stage'], 0) + 1
+        return counts
+
+def iter_evaluations(data):
+    """Liefert die Auswertungen nacheinander, ohne Zwischenlisten aufzubauen."""
+    yield from data.get('evaluations', [])
+
+progression = ProgressionLedger(bot_data)
+
+# ==================== ANMELDUNGEN ====================
+SIGNUP_RETENTION_DAYS = int(os.getenv('SIGNUP_RETENTION_DAYS', 14))
+
+class SignupIndex:
+    """Live-Index der Anmeldungen (Reaktionen) pro Ankündigung.
+
+    bot_data['signups'] bildet Message-ID -> {type, guild_id, channel_id,
+    timestamp, users} ab. Reaktions-Events ersetzen nur den Eintrag der
+    betroffenen Ankündigung, sodass das Journal nur diesen Eintrag neu
+    schreibt. Die Sets dienen dem O(1)-Abgleich.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        data.setdefault('signups', {})
+        self._lock = Lock()
+        self._prune()
+        self._members = {message_id: set(entry['users']) for message_id, entry in self.entries.items()}
+
+    @property
+    def entries(self):
+        return self.data['signups']
+
+    def _prune(self):
+        cutoff = time.time() - SIGNUP_RETENTION_DAYS * 86400
+        for message_id in [m for m, entry in self.entries.items() if entry['timestamp'] < cutoff]:
+            del self.entries[message_id]
+
+    def track(self, message_id, typ, guild_id, channel_id, timestamp):
+        message_id = str(message_id)
+        with self._lock:
+            self.entries[message_id] = {'type': typ, 'guild_id': guild_id, 'channel_id': channel_id, 'timestamp': timestamp, 'users': []}
+            self._members[message_id] = set()
+        persister.mark_dirty()
+
+    def add(self, message_id, user_id):
+        return self._update(str(message_id), str(user_id), True)
+
+    def remove(self, message_id, user_id):
+        return self._update(str(message_id), str(user_id), False)
+
+    def _update(self, message_id, user_id, present):
+        with self._lock:
+            members = self._members.get(message_id)
+            if members is None or (user_id in members) == present:
+                return False
+            entry = self.entries[message_id]
+            if present:
+                members.add(user_id)
+                users = entry['users'] + [user_id]
+            else:
+                members.discard(user_id)
+                users = [u for u in entry['users'] if u != user_id]
+            self.entries[message_id] = {**entry, 'users': users}
+        persister.mark_dirty()
+        return True
 
-    return None
+    def replace(self, message_id, user_ids):
+        """Setzt die Anmeldungen nach einem Abgleich mit Discord; True bei Abweichung."""
+        message_id = str(message_id)
+        with self._lock:
+            entry = self.entries.get(message_id)
+            if entry is None or set(user_ids) == self._members[message_id]:
+                return False
+            users = [u for u in entry['users'] if u in user_ids]
+            users.extend(u for u in user_ids if u not in self._members[message_id])
+            self.entries[message_id] = {**entry, 'users': users}
+            self._members[message_id] = set(users)
+        persister.mark_dirty()
+        return True
 
-# ==================== FLASK WEB APP ====================
-app = Flask(__name__)
-app.secret_key = Config.SECRET_KEY
-
-# HTML Template wird wegen Länge als separater String definiert
-HTML_TEMPLATE = '''<!DOCTYPE html>
-<html lang="de">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{% if user_role == 'ausbilderleitung' %}Ausbilderleitung{% else %}Ausbilder{% endif %} Portal</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: 'Segoe UI', sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; padding: 20px; }
-        .container { max-width: 1400px; margin: 0 auto; background: white; border-radius: 15px; box-shadow: 0 20px 60px rgba(0,0,0,0.3); overflow: hidden; }
-        .header { background: linear-gradient(135deg, #02244b 0%, #034078 100%); color: white; padding: 30px; position: relative; }
-        .header h1 { font-size: 2em; margin-bottom: 10px; }
-        .user-info { position: absolute; top: 20px; right: 30px; display: flex; align-items: center; gap: 15px; }
-        .avatar { width: 50px; height: 50px; border-radius: 50%; border: 3px solid white; }
-        .nav { background: #f8f9fa; padding: 15px 30px; display: flex; gap: 15px; border-bottom: 2px solid #e9ecef; flex-wrap: wrap; }
-        .nav button { padding: 10px 20px; border: none; background: #02244b; color: white; border-radius: 5px; cursor: pointer; transition: all 0.3s; }
-        .nav button:hover { background: #034078; transform: translateY(-2px); }
-        .nav button.active { background: #667eea; }
-        .content { padding: 30px; }
-        .login-container { max-width: 500px; margin: 100px auto; background: white; padding: 50px; border-radius: 15px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); text-align: center; }
-        .login-container h2 { color: #02244b; margin-bottom: 20px; font-size: 2em; }
-        .discord-btn { display: inline-block; padding: 15px 40px; background: #5865F2; color: white; text-decoration: none; border-radius: 8px; font-weight: 600; transition: all 0.3s; }
-        .discord-btn:hover { background: #4752C4; transform: translateY(-2px); }
-        .form-group { margin-bottom: 20px; }
-        .form-group label { display: block; font-weight: 600; margin-bottom: 8px; }
-        .form-group input, .form-group textarea, .form-group select { width: 100%; padding: 12px; border: 2px solid #e9ecef; border-radius: 5px; }
-        .form-group textarea { min-height: 100px; resize: vertical; }
-        .save-btn { padding: 15px 40px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; border-radius: 8px; font-weight: 600; cursor: pointer; transition: transform 0.3s; }
-        .save-btn:hover { transform: scale(1.05); }
-        .success { background: #d4edda; color: #155724; padding: 15px; border-radius: 5px; margin-bottom: 20px; }
-        .error { background: #f8d7da; color: #721c24; padding: 15px; border-radius: 5px; margin-bottom: 20px; }
-        .page { display: none; }
-        .page.active { display: block; }
-        .participant-row { display: grid; grid-template-columns: 2fr 1fr 1fr 100px; gap: 15px; margin-bottom: 15px; padding: 15px; background: #f8f9fa; border-radius: 8px; }
-        .editor-container { display: grid; grid-template-columns: 1fr 400px; gap: 20px; }
-        .editor-preview { background: #36393f; padding: 20px; border-radius: 10px; position: sticky; top: 20px; max-height: 80vh; overflow-y: auto; }
-        .embed-preview { background: #2f3136; border-left: 4px solid; border-radius: 4px; padding: 16px; color: #dcddde; }
-        .channel-selector { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin-top: 20px; }
-        .channel-option { padding: 20px; background: #f8f9fa; border: 2px solid #e9ecef; border-radius: 10px; cursor: pointer; text-align: center; transition: all 0.3s; }
-        .channel-option:hover, .channel-option.selected { border-color: #667eea; background: #e8eafe; }
-        .list-editor { background: white; border: 2px solid #e9ecef; border-radius: 5px; padding: 15px; }
-        .list-item { display: flex; gap: 10px; margin-bottom: 10px; }
-        .list-item input { flex: 1; padding: 8px; border: 1px solid #dee2e6; border-radius: 3px; }
-        .template-card { background: #f8f9fa; border-radius: 10px; padding: 20px; margin-bottom: 20px; border-left: 5px solid #667eea; }
-    </style>
-</head>
-<body>
-    {% if not session.get('user') %}
-    <div class="login-container">
-        <h2>🔐 Portal Login</h2>
-        <p style="color: #666; margin-bottom: 30px;">Melde dich mit Discord an</p>
-        {% if request.args.get('error') == 'no_permission' %}
-        <div class="error">❌ Du hast keine Berechtigung! Benötigte Rollen: Ausbilder oder Ausbilderleitung</div>
-        {% elif request.args.get('error') == 'no_guild' %}
-        <div class="error">❌ Bot ist keinem Server beigetreten</div>
-        {% elif request.args.get('error') == 'user_failed' %}
-        <div class="error">❌ Benutzerinformationen konnten nicht abgerufen werden</div>
-        {% elif request.args.get('error') == 'token_failed' %}
-        <div class="error">❌ Token-Austausch fehlgeschlagen</div>
-        {% elif request.args.get('error') %}
-        <div class="error">❌ Fehler: {{ request.args.get('error') }}</div>
-        {% endif %}
-        <a href="/login" class="discord-btn">Mit Discord anmelden</a>
-    </div>
-    {% else %}
-    <div class="container">
-        <div class="header">
-            <h1>{% if user_role == 'ausbilderleitung' %}Ausbilderleitungs{% else %}Ausbilder{% endif %}-Portal</h1>
-            <p>Willkommen, {{ session.user.username }}!</p>
-            <div class="user-info">
-                {% if session.user.avatar %}
-                <img src="https://cdn.discordapp.com/avatars/{{ session.user.id }}/{{ session.user.avatar }}.png" class="avatar">
-                {% endif %}
-                <div style="text-align: left;">
-                    <div style="font-weight: 600;">{{ session.user.username }}</div>
-                    <div style="font-size: 0.9em; opacity: 0.8;">{{ 'Ausbilderleitung' if user_role == 'ausbilderleitung' else 'Ausbilder' }}</div>
-                </div>
-            </div>
-        </div>
-        <div class="nav">
-            {% if user_role == 'ausbilderleitung' %}
-            <button onclick="showPage('templates')" class="active">Templates</button>
-            <button onclick="showPage('editor')">Embed Editor</button>
-            {% endif %}
-            <button onclick="showPage('evaluations')" {% if user_role != 'ausbilderleitung' %}class="active"{% endif %}>Auswertungen</button>
-            <button onclick="location.href='/logout'" style="margin-left: auto; background: #dc3545;">Abmelden</button>
-        </div>
-        <div class="content">
-            {% if success %}<div class="success">✅ {{ success }}</div>{% endif %}
-            {% if error %}<div class="error">❌ {{ error }}</div>{% endif %}
-
-            {% if user_role == 'ausbilderleitung' %}
-            <div class="page active" id="page-templates">
-                <h2 style="margin-bottom: 20px;">📋 Templates</h2>
-                {% for type in ['theorie', 'grund', 'stvo'] %}
-                <div class="template-card">
-                    <h3>{{ templates[type].title }}</h3>
-                    <form method="POST" action="/save/{{ type }}">
-                        <div class="form-group"><label>Titel:</label><input type="text" name="title" value="{{ templates[type].title }}" required></div>
-                        <div class="form-group"><label>Intro:</label><textarea name="intro" required>{{ templates[type].intro }}</textarea></div>
-                        <div class="form-group"><label>Themen:</label><div class="list-editor" id="topics-{{ type }}">{% for topic in templates[type].topics %}<div class="list-item"><input type="text" name="topics[]" value="{{ topic }}"><button type="button" onclick="this.parentElement.remove()">❌</button></div>{% endfor %}</div><button type="button" onclick="addListItem('topics-{{ type }}', 'topics[]')" style="padding: 8px 16px; background: #28a745; color: white; border: none; border-radius: 5px; cursor: pointer; margin-top: 10px;">+ Thema</button></div>
-                        <button type="submit" class="save-btn">Speichern</button>
-                    </form>
-                </div>
-                {% endfor %}
-            </div>
-
-            <div class="page" id="page-editor">
-                <h2 style="margin-bottom: 20px;">✏️ Embed Editor</h2>
-                <div class="editor-container">
-                    <div>
-                        <form id="embed-form" method="POST" action="/send_embed">
-                            <div class="form-group"><label>Nachricht:</label><textarea name="content" id="embed-content" rows="3"></textarea></div>
-                            <div class="form-group"><label>Titel:</label><input type="text" name="title" id="embed-title" required></div>
-                            <div class="form-group"><label>Beschreibung:</label><textarea name="description" id="embed-description" rows="5" required></textarea></div>
-                            <div class="form-group"><label>Farbe (Hex):</label><input type="text" name="color" id="embed-color" value="#667eea"></div>
-                            <div class="form-group"><label>Typ:</label><select name="message_type" id="message-type"><option value="theorie">Theorie</option><option value="grund">Grund</option><option value="stvo">StVO</option></select></div>
-                            <button type="button" class="save-btn" onclick="showChannelSelector()" style="margin-right: 10px;">Senden</button>
-                            <button type="button" class="save-btn" onclick="updatePreview()" style="background: #5865f2;">Vorschau</button>
-                            <div id="channel-selector-container" style="display: none;">
-                                <div class="channel-selector">
-                                    <div class="channel-option" onclick="selectChannel(this, 'announcement')">📢 Ankündigung</div>
-                                    <div class="channel-option" onclick="selectChannel(this, 'evaluation')">📊 Auswertung</div>
-                                    <div class="channel-option" onclick="selectChannel(this, 'custom')">🎯 Custom</div>
-                                </div>
-                                <input type="hidden" name="channel_type" id="channel-type-input">
-                                <div id="custom-channel-input" style="display: none; margin-top: 15px;"><input type="text" name="custom_channel_id" placeholder="Kanal-ID" style="width: 100%; padding: 12px; border: 2px solid #e9ecef; border-radius: 5px;"></div>
-                                <button type="submit" class="save-btn" style="margin-top: 20px; width: 100%;">📤 Jetzt senden</button>
-                            </div>
-                        </form>
-                    </div>
-                    <div class="editor-preview">
-                        <h3 style="color: white; margin-bottom: 15px;">Vorschau:</h3>
-                        <div id="live-preview"><div class="embed-preview" style="border-left-color: #667eea;"><div style="font-size: 16px; font-weight: 600; margin-bottom: 8px;">Titel</div><div style="font-size: 14px;">Beschreibung</div></div></div>
-                    </div>
-                </div>
-            </div>
-            {% endif %}
-
-            <div class="page {% if user_role != 'ausbilderleitung' %}active{% endif %}" id="page-evaluations">
-                <h2 style="margin-bottom: 20px;">📊 Auswertungen</h2>
-                <form method="POST" action="/create_evaluation">
-                    <div class="form-group"><label>Typ:</label><select name="training_type" id="training-type" onchange="updateMaxPoints()" required><option value="">Wählen</option><option value="theorie">Theorie</option><option value="grund">Grund</option><option value="stvo">StVO</option></select></div>
-                    <div id="participants-container"></div>
-                    <button type="button" onclick="addParticipant()" style="padding: 8px 16px; background: #28a745; color: white; border: none; border-radius: 5px; cursor: pointer;">+ Teilnehmer</button>
-                    <button type="submit" class="save-btn" style="margin-top: 20px;">Senden</button>
-                </form>
-            </div>
-        </div>
-    </div>
-    <script>
-        function showPage(p) { document.querySelectorAll('.page').forEach(x => x.classList.remove('active')); document.querySelectorAll('.nav button').forEach(x => x.classList.remove('active')); document.getElementById('page-' + p).classList.add('active'); event.target.classList.add('active'); }
-        function addListItem(c, f) { const d = document.createElement('div'); d.className = 'list-item'; d.innerHTML = '<input type="text" name="' + f + '" value=""><button type="button" onclick="this.parentElement.remove()">❌</button>'; document.getElementById(c).appendChild(d); }
-        function updateMaxPoints() { const t = document.getElementById('training-type').value; const m = (t === 'theorie' || t === 'grund') ? 50 : 25; document.querySelectorAll('.points-input').forEach(i => { i.max = m; i.placeholder = '0-' + m; }); }
-        function addParticipant() { const t = document.getElementById('training-type').value; if (!t) { alert('Typ wählen!'); return; } const m = (t === 'theorie' || t === 'grund') ? 50 : 25; const d = document.createElement('div'); d.className = 'participant-row'; d.innerHTML = '<input type="text" name="user_id[]" placeholder="User ID" required><input type="number" name="points[]" class="points-input" min="0" max="' + m + '" placeholder="0-' + m + '" required><input type="number" name="grade[]" min="1" max="6" placeholder="Note" required><button type="button" onclick="this.parentElement.remove()" style="padding: 10px 20px; background: #dc3545; color: white; border: none; border-radius: 5px; cursor: pointer;">❌</button>'; document.getElementById('participants-container').appendChild(d); }
-        function updatePreview() { const t = document.getElementById('embed-title').value || 'Titel'; const d = document.getElementById('embed-description').value || 'Beschreibung'; const c = document.getElementById('embed-color').value || '#667eea'; document.getElementById('live-preview').innerHTML = '<div class="embed-preview" style="border-left-color: ' + c + ';"><div style="font-size: 16px; font-weight: 600; margin-bottom: 8px;">' + t + '</div><div style="font-size: 14px;">' + d + '</div></div>'; }
-        function showChannelSelector() { const f = document.getElementById('embed-form'); if (!f.checkValidity()) { f.reportValidity(); return; } document.getElementById('channel-selector-container').style.display = 'block'; }
-        function selectChannel(e, t) { document.querySelectorAll('.channel-option').forEach(x => x.classList.remove('selected')); e.classList.add('selected'); document.getElementById('channel-type-input').value = t; document.getElementById('custom-channel-input').style.display = t === 'custom' ? 'block' : 'none'; }
-        ['embed-title', 'embed-description', 'embed-color'].forEach(id => { const el = document.getElementById(id); if (el) el.addEventListener('input', updatePreview); });
-    </script>
-    {% endif %}
-</body>
-</html>'''
-
-@app.route('/')
-def index():
-    # Prüfe ob OAuth Code in URL (Discord Redirect)
-    code = request.args.get('code')
-    if code and not session.get('user'):
-        # Weiterleitung zum Callback
-        return redirect(url_for('callback', code=code))
-
-    if not session.get('user'):
-        return render_template_string(HTML_TEMPLATE, session=session, request=request)
-
-    user_role = session.get('user_role')
-    if not user_role:
-        return redirect('/logout')
-
-    return render_template_string(HTML_TEMPLATE, templates=bot_data['templates'], session=session, user_role=user_role, success=request.args.get('success'), error=request.args.get('error'), request=request)
-
-@app.route('/login')
-def login():
-    params = {'client_id': Config.CLIENT_ID, 'redirect_uri': Config.REDIRECT_URI, 'response_type': 'code', 'scope': 'identify guilds'}
-    return redirect(f'{Config.OAUTH2_URL}?{urlencode(params)}')
-
-@app.route('/callback')
-def callback():
-    code = request.args.get('code')
-    if not code:
-        print("❌ Kein Code erhalten")
-        return redirect('/?error=no_code')
-
-    data = {'client_id': Config.CLIENT_ID, 'client_secret': Config.CLIENT_SECRET, 'grant_type': 'authorization_code', 'code': code, 'redirect_uri': Config.REDIRECT_URI}
-    response = requests.post(Config.TOKEN_URL, data=data, headers={'Content-Type': 'application/x-www-form-urlencoded'})
-
-    print(f"📡 Token Response Status: {response.status_code}")
-
-    if response.status_code != 200:
-        print(f"❌ Token Fehler: {response.text}")
-        return redirect('/?error=token_failed')
-
-    token_data = response.json()
-    access_token = token_data.get('access_token')
-    user_info = get_user_info(access_token)
-
-    if not user_info:
-        print("❌ User Info konnte nicht abgerufen werden")
-        return redirect('/?error=user_failed')
-
-    print(f"✅ User: {user_info.get('username')} (ID: {user_info.get('id')})")
-
-    # Guild-ID verwenden (entweder aus ENV oder aus Bot)
-    guild_id = Config.GUILD_ID
-    if not guild_id and bot.guilds:
-        guild_id = str(bot.guilds[0].id)
-        print(f"🏰 Guild ID (vom Bot): {guild_id}")
-    elif guild_id:
-        print(f"🏰 Guild ID (aus Config): {guild_id}")
-    else:
-        print("❌ Keine Guild-ID verfügbar")
-        return redirect('/?error=no_guild')
-
-    user_role = check_user_roles(user_info['id'], guild_id)
-    print(f"👤 Rolle gefunden: {user_role}")
-
-    if not user_role:
-        print(f"❌ Keine Berechtigung für User {user_info.get('username')}")
-        # Debug: Zeige alle Rollen des Users
-        member = get_guild_member(guild_id, user_info['id'], Config.TOKEN)
-        if member:
-            print(f"📋 User Rollen: {member.get('roles', [])}")
-        return redirect('/?error=no_permission')
-
-    session['user'] = user_info
-    session['user_role'] = user_role
-    session['access_token'] = access_token
-
-    print(f"✅ Login erfolgreich: {user_info.get('username')} als {user_role}")
-    return redirect('/?success=Angemeldet!')
-
-@app.route('/logout')
-def logout():
-    session.clear()
-    return redirect('/')
-
-@app.route('/save/<type>', methods=['POST'])
-def save_template(type):
-    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
-        return redirect('/')
-
-    bot_data['templates'][type] = {
-        'title': request.form.get('title'),
-        'intro': request.form.get('intro'),
-        'topics': request.form.getlist('topics[]'),
-        'additional_info': request.form.getlist('additional_info[]') or [],
-        'grading': request.form.getlist('grading[]') or [],
-        'benefits': request.form.getlist('benefits[]') or []
-    }
-    save_data(bot_data)
-    return redirect('/?success=Gespeichert!')
+    def active(self, since=None, guild_id=None):
+        """Ankündigungen ab `since` (Standard: letzte 24h), neueste zuerst; optional nur einer Guild."""
+        since = time.time() - 86400 if since is None else since
+        with self._lock:
+            result = [
+                {'message_id': message_id, **entry, 'users': list(entry['users'])}
+                for message_id, entry in self.entries.items()
+                if entry['timestamp'] >= since and (guild_id is None or str(entry['guild_id']) == str(guild_id))
+            ]
+        return sorted(result, key=lambda e: e['timestamp'], reverse=True)
+
+signups = SignupIndex(bot_data)
+
+# ==================== JOB QUEUE ====================
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 6))
+JOB_RETRY_BASE = float(os.getenv('JOB_RETRY_BASE', 5))  # Sekunden
+JOB_RETRY_CAP = float(os.getenv('JOB_RETRY_CAP', 600))
+
+def backoff_delay(attempt: int) -> float:
+    """Exponentielles Backoff mit Jitter (zwischen 50 % und 100 % des Werts)."""
+    return min(JOB_RETRY_BASE * 2 ** (attempt - 1), JOB_RETRY_CAP) * random.uniform(0.5, 1.0)
+
+def new_ulid() -> str:
+    """ULID: 48 Bit Millisekunden + 80 Bit Zufall, Crockford-Base32, zeitlich sortierbar."""
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(secrets.token_bytes(10), 'big')
+    return ''.join(CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+class JobQueue:
+    """Thread-sichere Übergabe von Web-Jobs (Flask-Thread) an den Bot-Event-Loop.
+
+    Jeder Job wird vor dem Einreihen in bot_data['jobs'] gespeichert und erst
+    nach erfolgreicher Ausführung als 'done' markiert (at-least-once). Offene
+    Jobs werden beim Start erneut eingereiht. Ein Idempotenz-Schlüssel (z.B.
+    aus dem Formular) verhindert, dass ein wiederholtes Absenden doppelt postet.
+
+    Fehlgeschlagene Jobs werden mit Backoff erneut versucht; nach
+    JOB_MAX_ATTEMPTS Versuchen landen sie als 'dead' in der Dead-Letter-Liste.
+    Erledigte Teilschritte liegen getrennt in bot_data['job_steps'] (Job-ID ->
+    steps), damit ein neuer Versuch dort weitermacht, wo der letzte
+    abgebrochen ist - ein Checkpoint schreibt so nur diesen kleinen Eintrag
+    ins Journal, nicht den ganzen Job samt Nutzdaten.
+
+    Die Queue ist nach Guild partitioniert: jede Guild hat eine eigene
+    asyncio.Queue und einen eigenen Worker, ein langsamer Job blockiert so
+    nur seine Guild.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        data.setdefault('jobs', {})
+        data.setdefault('job_steps', {})
+        # Gesendete Embeds, unter der ID ihres Jobs abgelegt (siehe apply_action); sie bleiben
+        # wie bisher dauerhaft erhalten, auch ältere Einträge ('msg_<ts>') ohne Job
+        data.setdefault('messages', {})
+        self._lock = Lock()
+        self._loop = None
+        self._spawn = None
+        self._queues = {}
+        self._backlog = []
+        # Der Web-Prozess liest die Jobs nur (Dead-Letter-Liste), ausgeführt werden sie im Bot-Prozess
+        if Config.PROCESS_ROLE != 'web':
+            self._prune()
+            # Offene Jobs aus dem letzten Lauf werden beim bind() erneut eingereiht
+            self._backlog = [self._runtime(job_id) for job_id, job in self.jobs.items() if job['status'] == 'pending']
+        self._keys = {job['key']: job_id for job_id, job in self.jobs.items() if job.get('key')}
+        if self._backlog:
+            log('jobs_recovered', f"♻️ {len(self._backlog)} offene Jobs werden erneut ausgeführt", count=len(self._backlog))
+        self.submitted = 0
+        self.dispatched = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+
+    @property
+    def jobs(self):
+        return self.data['jobs']
+
+    @property
+    def messages(self):
+        return self.data['messages']
+
+    @property
+    def job_steps(self):
+        return self.data['job_steps']
+
+    def steps(self, job_id):
+        """Erledigte Teilschritte eines Jobs (ältere Jobs führen sie noch im Job selbst)."""
+        steps = self.job_steps.get(job_id)
+        return steps if steps is not None else self.jobs.get(job_id, {}).get('steps', {})
+
+    def _prune(self):
+        cutoff = (datetime.now().timestamp() - JOB_RETENTION_DAYS * 86400)
+        for job_id, job in list(self.jobs.items()):
+            if job['status'] in ('done', 'failed') and record_time(job) < cutoff:
+                del self.jobs[job_id]
+        for job_id in [j for j in self.job_steps if j not in self.jobs]:
+            del self.job_steps[job_id]
+
+    def _runtime(self, job_id):
+        job = self.jobs[job_id]
+        return {'id': job_id, 'kind': job['kind'], 'data': job['data'], 'guild_id': job.get('guild_id'), 'steps': dict(self.steps(job_id)), 'enqueued': time.monotonic()}
+
+    @property
+    def bound(self):
+        return self._loop is not None
+
+    def bind(self, loop, spawn):
+        """Bindet die Queue an den Bot-Loop. Muss im Loop selbst aufgerufen werden.
+
+        `spawn(guild_id)` startet den Worker einer Guild, sobald ihre Partition entsteht.
+        """
+        with self._lock:
+            self._loop = loop
+            self._spawn = spawn
+            now = time.time()
+            for job in self._backlog:
+                # Ein geplanter Wiederholungsversuch behält seine Wartezeit über den Neustart
+                delay = self.jobs[job['id']].get('next_attempt_at', 0) - now
+                if delay > 0:
+                    self.requeue(job, delay)
+                else:
+                    self._put(job)
+            self._backlog.clear()
+
+    def _partition(self, guild_id):
+        """Queue einer Guild; legt sie beim ersten Job samt Worker an (nur im Loop)."""
+        queue = self._queues.get(guild_id)
+        if queue is None:
+            queue = self._queues[guild_id] = asyncio.Queue()
+            self._spawn(guild_id)
+        return queue
+
+    def _put(self, job):
+        self._partition(job['guild_id']).put_nowait(job)
+
+    def submit(self, kind, data, key=None, guild_id=None):
+        """Speichert und reiht einen Job ein; gibt die Job-ID zurück. Darf aus jedem Thread aufgerufen werden.
+
+        Ist `key` bereits bekannt, wird nichts eingereiht und die ID des
+        vorhandenen Jobs zurückgegeben.
+        """
+        with self._lock:
+            if key and key in self._keys:
+                return self._keys[key]
+            job_id = new_ulid()
+            now = datetime.now()
+            self.jobs[job_id] = {'kind': kind, 'data': data, 'guild_id': str(guild_id) if guild_id else None, 'status': 'pending', 'key': key, 'timestamp': int(now.timestamp()), 'created_at': now.isoformat()}
+            if key:
+                self._keys[key] = job_id
+            self.submitted += 1
+            job = self._runtime(job_id)
+            loop = self._loop
+            if loop is None:
+                self._backlog.append(job)
+        persister.mark_dirty()
+        if loop is not None:
+            loop.call_soon_threadsafe(self._put, job)
+        return job_id
+
+    def finish(self, job_id, status='done'):
+        """Markiert einen Job als erledigt ('done') oder endgültig fehlgeschlagen ('failed')."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        self.jobs[job_id] = {**job, 'status': status, 'finished_at': datetime.now().isoformat()}
+        self.job_steps.pop(job_id, None)
+        persister.mark_dirty()
+
+    def checkpoint(self, job):
+        """Speichert die erledigten Teilschritte eines laufenden Jobs."""
+        if job['id'] in self.jobs:
+            self.job_steps[job['id']] = dict(job['steps'])
+            persister.mark_dirty()
+
+    def fail(self, job, error):
+        """Plant einen neuen Versuch mit Backoff oder verschiebt den Job in die Dead-Letter-Liste."""
+        record = self.jobs.get(job['id'])
+        if record is None:
+            return
+        attempts = record.get('attempts', 0) + 1
+        update = {'attempts': attempts, 'last_error': str(error)}
+        self.job_steps[job['id']] = dict(job['steps'])
+        if attempts >= JOB_MAX_ATTEMPTS:
+            update.update(status='dead', finished_at=datetime.now().isoformat())
+            log('job_dead', f"☠️ Job {job['id']} nach {attempts} Versuchen aufgegeben: {error}", level='error', job_id=job['id'], kind=job['kind'], attempts=attempts, error=str(error))
+        else:
+            delay = backoff_delay(attempts)
+            update['next_attempt_at'] = time.time() + delay
+            log('job_retry', f"🔁 Job {job['id']} fehlgeschlagen ({error}), Versuch {attempts + 1} in {delay:.0f}s", level='warning', job_id=job['id'], kind=job['kind'], attempt=attempts + 1, delay=round(delay, 1), error=str(error))
+            self.requeue(job, delay)
+        self.jobs[job['id']] = {**record, **update}
+        persister.mark_dirty()
+
+    def dead_letters(self, guild_id=None):
+        """Dead-Letter-Jobs, neueste zuerst; optional nur einer Guild."""
+        return [
+            {'id': job_id, **job, 'steps': self.steps(job_id)} for job_id, job in sorted(list(self.jobs.items()), reverse=True)
+            if job['status'] == 'dead' and (guild_id is None or record_guild(job) == str(guild_id))
+        ]
+
+    def retry(self, job_id):
+        """Reiht einen Dead-Letter-Job erneut ein. Darf aus jedem Thread aufgerufen werden."""
+        with self._lock:
+            record = self.jobs.get(job_id)
+            if record is None or record['status'] != 'dead':
+                return False
+            self.jobs[job_id] = {**record, 'status': 'pending', 'attempts': 0, 'next_attempt_at': 0}
+            job = self._runtime(job_id)
+            loop = self._loop
+            if loop is None:
+                self._backlog.append(job)
+        persister.mark_dirty()
+        if loop is not None:
+            loop.call_soon_threadsafe(self._put, job)
+        return True
 
-@app.route('/send_embed', methods=['POST'])
-def send_embed():
-    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
-        return redirect('/')
+    def known(self, key):
+        """True, wenn ein Job mit diesem Idempotenz-Schlüssel existiert."""
+        with self._lock:
+            return key in self._keys
+
+    def is_pending(self, job_id):
+        job = self.jobs.get(job_id)
+        return job is not None and job['status'] == 'pending'
+
+    def requeue(self, job, delay):
+        """Reiht einen fehlgeschlagenen Job nach `delay` Sekunden erneut ein (nur im Loop)."""
+        def put():
+            job['enqueued'] = time.monotonic()
+            self._put(job)
+        self._loop.call_later(delay, put)
+
+    async def get(self, guild_id):
+        """Wartet (ohne Polling) auf den nächsten Job einer Guild."""
+        job = await self._partition(guild_id).get()
+        wait = time.monotonic() - job['enqueued']
+        with self._lock:
+            self.dispatched += 1
+            self.last_wait = wait
+            self.max_wait = max(self.max_wait, wait)
+            self.total_wait += wait
+        return job
+
+    def depth(self):
+        with self._lock:
+            return len(self._backlog) + sum(queue.qsize() for queue in list(self._queues.values()))
+
+    def stats(self, guild_id=None):
+        """Kennzahlen der Queue; mit `guild_id` Tiefe und Partitionen nur dieser Guild."""
+        if guild_id is None:
+            depth = self.depth()
+        with self._lock:
+            partitions = {key: queue for key, queue in list(self._queues.items()) if guild_id is None or record_guild({'guild_id': key}) == str(guild_id)}
+            if guild_id is not None:
+                depth = sum(queue.qsize() for queue in partitions.values())
+            return {
+                'depth': depth,
+                'partitions': {str(key): queue.qsize() for key, queue in partitions.items()},
+                'submitted': self.submitted,
+                'dispatched': self.dispatched,
+                'last_dispatch_ms': round(self.last_wait * 1000, 3),
+                'avg_dispatch_ms': round(self.total_wait / self.dispatched * 1000, 3) if self.dispatched else 0.0,
+                'max_dispatch_ms': round(self.max_wait * 1000, 3)
+            }
+
+job_queue = JobQueue(bot_data)
+
+# ==================== JOB-BUS ====================
+class JobBus(ABC):
+    """Übergabe von Aktionen vom Web- an den Bot-Prozess (PROCESS_ROLE=web/bot).
+
+    `publish()` legt eine Nachricht ab. `claim()` teilt bis zu `limit`
+    fällige Nachrichten mit einer Lease zu; `ack()` entfernt eine Nachricht,
+    `nack()` gibt sie nach `delay` Sekunden wieder frei. Nachrichten ohne
+    Ack werden nach Ablauf der Lease erneut ausgeliefert (at-least-once).
+    Ein Redis-Backend kann das z.B. mit Streams und XACK umsetzen.
+    """
+
+    @abstractmethod
+    def publish(self, kind, data, key=None, guild_id=None):
+        ...
+
+    @abstractmethod
+    def claim(self, limit=10, lease=30):
+        ...
+
+    @abstractmethod
+    def ack(self, message_id):
+        ...
+
+    @abstractmethod
+    def nack(self, message_id, delay=0):
+        ...
+
+    @abstractmethod
+    def depth(self):
+        ...
+
+class SqliteJobBus(JobBus):
+    """Job-Bus in einer lokalen SQLite-Datei (WAL), geteilt von Web- und Bot-Prozess."""
+
+    SCHEMA = '''CREATE TABLE IF NOT EXISTS bus (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        guild_id TEXT,
+        key TEXT UNIQUE,
+        payload TEXT NOT NULL,
+        available_at REAL NOT NULL,
+        deliveries INTEGER NOT NULL DEFAULT 0
+    )'''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(self.SCHEMA)
+
+    def _connect(self):
+        # Eine Verbindung pro Thread (Flask-Threads, Executor des Bots)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def publish(self, kind, data, key=None, guild_id=None):
+        conn = self._connect()
+        message_id = new_ulid()
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO bus (id, kind, guild_id, key, payload, available_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (message_id, kind, str(guild_id) if guild_id else None, key, json.dumps(data, ensure_ascii=False), time.time())
+        )
+        if cursor.rowcount == 0:
+            # Idempotenz-Schlüssel schon vorhanden
+            return conn.execute('SELECT id FROM bus WHERE key = ?', (key,)).fetchone()[0]
+        return message_id
+
+    def claim(self, limit=10, lease=30):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('SELECT id, kind, guild_id, key, payload, deliveries FROM bus WHERE available_at <= ? ORDER BY id LIMIT ?', (now, limit)).fetchall()
+            conn.executemany('UPDATE bus SET available_at = ?, deliveries = deliveries + 1 WHERE id = ?', [(now + lease, row[0]) for row in rows])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [{'id': row[0], 'kind': row[1], 'guild_id': row[2], 'key': row[3], 'data': json.loads(row[4]), 'deliveries': row[5] + 1} for row in rows]
+
+    def ack(self, message_id):
+        self._connect().execute('DELETE FROM bus WHERE id = ?', (message_id,))
+
+    def nack(self, message_id, delay=0):
+        self._connect().execute('UPDATE bus SET available_at = ? WHERE id = ?', (time.time() + delay, message_id))
+
+    def depth(self):
+        return self._connect().execute('SELECT COUNT(*) FROM bus').fetchone()[0]
+
+def create_job_bus(url):
+    if url.startswith('sqlite:///'):
+        return SqliteJobBus(url[len('sqlite:///'):])
+    raise ValueError(f"Unbekannter Job-Bus: {url}")
+
+# Im Ein-Prozess-Betrieb gehen Aktionen direkt an die job_queue
+job_bus = create_job_bus(Config.JOB_BUS_URL) if Config.PROCESS_ROLE != 'all' else None
+
+class ReplicaRefresher:
+    """Web-Prozess: liest bot_data neu ein, sobald der Bot-Prozess geschrieben hat.
+
+    Jeder Wert wird als neues Objekt unter seinem Schlüssel eingesetzt -
+    eine einzelne, atomare Zuweisung. Request-Threads, die gerade über den
+    alten Stand iterieren, lesen ihn unverändert zu Ende; die Komponenten
+    greifen über bot_data[...] zu und sehen beim nächsten Zugriff den neuen
+    Stand. Abgeleitete Indizes werden verworfen.
+    """
+
+    def __init__(self, data, interval=float(os.getenv('REPLICA_REFRESH', 2.0))):
+        self.data = data
+        self.interval = interval
+        self._lock = Lock()
+        self._next = 0.0
+        self._signature = self._stat()
+
+    @staticmethod
+    def _stat():
+        return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None for path in (DATA_FILE, JOURNAL_FILE))
+
+    def maybe_refresh(self):
+        if time.monotonic() < self._next or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._next = time.monotonic() + self.interval
+            signature = self._stat()
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            fresh = store.load()
+            for key, value in fresh.items():
+                self.data[key] = value
+            history.reset()
+            for typ in list(self.data.get('templates', {})):
+                template_versions[typ] = template_versions.get(typ, 0) + 1
+            return True
+        finally:
+            self._lock.release()
+
+replica = ReplicaRefresher(bot_data) if Config.PROCESS_ROLE == 'web' else None
+
+# ==================== HTTP CLIENT ====================
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def retry_delay(attempt: int, retry_after=None) -> float:
+    """Wartezeit vor dem nächsten Versuch: Retry-After falls vorhanden, sonst exponentiell."""
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return min(0.5 * 2 ** attempt, 8.0)
+
+class DiscordHttp:
+    """Synchroner HTTP-Client mit Connection-Pool, Timeouts und Retry (Flask-Seite).
+
+    Nicht-idempotente Requests (POST) werden nur bei 429 oder fehlgeschlagenem
+    Verbindungsaufbau wiederholt, damit z.B. ein OAuth-Code nicht doppelt
+    eingelöst wird. Alle Wartezeiten zusammen bleiben unter `retry_budget`:
+    verlangt Retry-After mehr, wird die Antwort sofort zurückgegeben, statt
+    einen Waitress-Worker minutenlang zu blockieren.
+    """
+
+    def __init__(self, base_url=Config.API_ENDPOINT, retries=Config.HTTP_RETRIES,
+                 timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT),
+                 retry_budget=Config.HTTP_RETRY_BUDGET):
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.timeout = timeout
+        self.retry_budget = retry_budget
+        self._session = None
+        self._session_lock = Lock()
+
+    @property
+    def session(self):
+        # requests wird erst beim ersten Request geladen - der Bot-Prozess braucht es nicht
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        import requests
+        if not url.startswith('http'):
+            url = self.base_url + url
+        idempotent = method.upper() in ('GET', 'HEAD', 'PUT', 'DELETE')
+        kwargs.setdefault('timeout', self.timeout)
+        waited = 0.0
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                # ConnectTimeout ist eine ConnectionError; ReadTimeout nicht
+                delay = retry_delay(attempt)
+                if last or not (idempotent or isinstance(e, requests.ConnectTimeout)) or waited + delay > self.retry_budget:
+                    raise
+                waited += delay
+                time.sleep(delay)
+                continue
+            except requests.Timeout:
+                delay = retry_delay(attempt)
+                if last or not idempotent or waited + delay > self.retry_budget:
+                    raise
+                waited += delay
+                time.sleep(delay)
+                continue
+            if not last and (response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUS)):
+                delay = retry_delay(attempt, response.headers.get('Retry-After'))
+                if waited + delay <= self.retry_budget:
+                    waited += delay
+                    time.sleep(delay)
+                    continue
+                log('http_retry_budget', f"⏱️ Retry-After {delay:.1f}s überschreitet das Budget - {method} {url} wird nicht wiederholt", level='warning', method=method, url=url, status=response.status_code, delay=delay)
+            return response
 
-    try:
-        content = request.form.get('content', '')
-        title = request.form.get('title')
-        description = request.form.get('description')
-        color = request.form.get('color', '#667eea').replace('#', '')
-        message_type = request.form.get('message_type')
-        channel_type = request.form.get('channel_type')
-        custom_channel_id = request.form.get('custom_channel_id', '')
-
-        if channel_type == 'custom' and custom_channel_id:
-            channel_id = custom_channel_id
-        elif channel_type in ['announcement', 'evaluation']:
-            channel_id = Config.CHANNELS[message_type][channel_type]
-        else:
-            return redirect('/?error=Kein Kanal!')
-
-        embed_data = {
-            'content': content,
-            'embed': {
-                'title': title,
-                'description': description,
-                'color': int(color, 16) if color else 6736106
-            },
-            'channel_id': channel_id,
-            'type': message_type,
-            'created_at': datetime.now().isoformat()
-        }
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
 
-        new_id = f"msg_{int(datetime.now().timestamp())}"
-        bot_data['messages'][new_id] = embed_data
-        active_evaluations[f'send_{new_id}'] = embed_data
-        save_data(bot_data)
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
 
-        return redirect('/?success=Wird gesendet...')
-    except Exception as e:
-        return redirect(f'/?error={str(e)}')
+http = DiscordHttp()
 
-@app.route('/create_evaluation', methods=['POST'])
-def create_evaluation():
-    if not session.get('user'):
-        return redirect('/')
+# OAuth2 Helper Funktionen
+def get_json(url, headers, strict=False):
+    """GET gegen die Discord-API; das JSON bei 200, sonst None.
 
+    Mit `strict` steht None nur für eine eindeutige Antwort (403/404);
+    Netzwerkfehler, 429 und 5xx lösen ConnectionError aus.
+    """
+    import requests
     try:
-        training_type = request.form.get('training_type')
-        user_ids = request.form.getlist('user_id[]')
-        points = request.form.getlist('points[]')
-        grades = request.form.getlist('grade[]')
-
-        if not training_type or not user_ids:
-            return redirect('/?error=Felder ausfüllen!')
+        response = http.get(url, headers=headers)
+    except requests.RequestException as e:
+        log('http_error', f"❌ HTTP Fehler: {e}", level='error', error=str(e))
+        if strict:
+            raise ConnectionError(str(e)) from e
+        return None
+    if response.status_code == 200:
+        return response.json()
+    if strict and response.status_code not in (403, 404):
+        raise ConnectionError(f"Discord-API antwortet mit HTTP {response.status_code}")
+    return None
 
-        evaluation_data = {'training_type': training_type, 'entries': []}
+def get_user_info(access_token):
+    return get_json('/users/@me', {'Authorization': f'Bearer {access_token}'})
+
+def get_user_guilds(access_token):
+    """Guilds des eingeloggten Users (OAuth-Scope 'guilds')."""
+    return get_json('/users/@me/guilds', {'Authorization': f'Bearer {access_token}'})
+
+def get_guild_member(guild_id, user_id, bot_token, strict=False):
+    return get_json(f'/guilds/{guild_id}/members/{user_id}', {'Authorization': f'Bot {bot_token}'}, strict)
+
+# ==================== MEMBER-ROLLEN-CACHE ====================
+class MemberRoleCache:
+    """Rollen-Lookup für Logins und Berechtigungsprüfungen.
+
+    Reihenfolge: Gateway-Member-Cache des Bots (intents.members), dann ein
+    LRU+TTL-Cache mit REST-Ergebnissen, erst danach ein REST-Call.
+    on_member_update/on_member_remove invalidieren die REST-Einträge.
+    """
+
+    def __init__(self, ttl=float(os.getenv('MEMBER_CACHE_TTL', 300)), maxsize=int(os.getenv('MEMBER_CACHE_SIZE', 1024))):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.gateway_hits = 0
+        self.cache_hits = 0
+        self.rest_calls = 0
+
+    def get_roles(self, guild_id, user_id, strict=False):
+        """Gibt die Rollen-IDs (als Strings) zurück oder None, wenn kein Mitglied.
+
+        Mit `strict` löst ein REST-Fehler ohne eindeutige Antwort ConnectionError aus (siehe get_json).
+        """
+        roles = self._from_gateway(guild_id, user_id)
+        if roles is not None:
+            self.gateway_hits += 1
+            return roles
+
+        key = (str(guild_id), str(user_id))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.cache_hits += 1
+                return entry[1]
+
+        self.rest_calls += 1
+        member = get_guild_member(guild_id, user_id, Config.TOKEN, strict)
+        if not member:
+            return None
+        roles = member.get('roles', [])
+        with self._lock:
+            self._entries[key] = (now + self.ttl, roles)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return roles
+
+    def _from_gateway(self, guild_id, user_id):
+        guild = bot.get_guild(int(guild_id))
+        member = guild.get_member(int(user_id)) if guild else None
+        if not member:
+            return None
+        return [str(r.id) for r in member.roles if not r.is_default()]
+
+    def invalidate(self, guild_id, user_id):
+        with self._lock:
+            self._entries.pop((str(guild_id), str(user_id)), None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'size': size, 'gateway_hits': self.gateway_hits, 'cache_hits': self.cache_hits, 'rest_calls': self.rest_calls}
+
+member_roles = MemberRoleCache()
+
+class RoleVersions:
+    """Versionszähler pro User, erhöht durch Gateway-Events bei Rollenänderung oder Austritt.
+
+    Sessions merken sich die Version beim Login; weicht sie ab, wird die
+    Berechtigung neu bestimmt. Die Prüfung ist ein Dict-Lookup ohne REST.
+    """
+
+    def __init__(self):
+        self._versions = {}
+
+    def get(self, user_id):
+        return self._versions.get(str(user_id), 0)
+
+    def bump(self, user_id):
+        key = str(user_id)
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+role_versions = RoleVersions()
+
+def role_from_ids(user_roles, guild_id=None):
+    leitung, ausbilder = guild_configs.staff_roles(guild_id)
+    if any(role in leitung for role in user_roles):
+        return 'ausbilderleitung'
 
-        for i in range(len(user_ids)):
-            user_id_str = user_ids[i].strip().strip('<@!>')
-            try:
-                user_id = int(user_id_str)
-                evaluation_data['entries'].append({
-                    'user_id': user_id,
-                    'points': int(points[i]),
-                    'grade': int(grades[i]),
-                    'passed': int(grades[i]) <= 4
-                })
-            except ValueError:
-                continue
+    if any(role in ausbilder for role in user_roles):
+        return 'ausbilder'
 
-        if not evaluation_data['entries']:
-            return redirect('/?error=Keine Teilnehmer!')
+    return None
 
-        eval_id = f"web_eval_{int(datetime.now().timestamp())}"
-        active_evaluations[eval_id] = evaluation_data
+def check_user_roles(user_id, guild_id):
+    user_roles = member_roles.get_roles(guild_id, user_id)
+    if user_roles is None:
+        return None
+    return role_from_ids(user_roles, guild_id)
 
-        return redirect('/?success=Wird verarbeitet...')
-    except Exception as e:
-        return redirect(f'/?error={str(e)}')
+# Version der Templates - wird von /save/<type> erhöht
+template_versions = {}
 
-def run_flask():
-    port = int(os.getenv('PORT', 5000))
-    print(f"\n{'='*50}")
-    print(f"🌐 Dashboard: http://localhost:{port}")
-    print(f"{'='*50}\n")
-    app.run(host='0.0.0.0', port=port, debug=False)
+def handle_sigterm(signum, frame):
+    # bot.run() beendet sich bei KeyboardInterrupt sauber
+    raise KeyboardInterrupt
 
 # ==================== BOT ====================
 intents = discord.Intents.default()
@@ -497,89 +1728,850 @@ intents.message_content = True
 intents.members = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
-def get_grade_from_points(points: int, training_type: str) -> int:
-    if training_type in ['theorie', 'grund']:
-        if points >= 45: return 1
-        elif points >= 40: return 2
-        elif points >= 33: return 3
-        elif points >= 25: return 4
-        elif points >= 15: return 5
-        else: return 6
-    else:
-        if points >= 22: return 1
-        elif points >= 17: return 2
-        elif points >= 13: return 3
-        elif points >= 9: return 4
-        elif points >= 4: return 5
-        else: return 6
-
-async def assign_role(member: discord.Member, training_type: str) -> bool:
-    try:
-        if training_type == 'theorie':
-            await member.remove_roles(member.guild.get_role(int(Config.ROLES['theorie']['pending'])))
-            await member.add_roles(member.guild.get_role(int(Config.ROLES['theorie']['passed'])))
-            await member.add_roles(member.guild.get_role(int(Config.ROLES['grund']['pending'])))
-        elif training_type == 'grund':
-            await member.remove_roles(member.guild.get_role(int(Config.ROLES['grund']['pending'])))
-            await member.add_roles(member.guild.get_role(int(Config.ROLES['grund']['passed'])))
-            await member.add_roles(member.guild.get_role(int(Config.ROLES['stvo']['pending'])))
-        elif training_type == 'stvo':
-            await member.remove_roles(member.guild.get_role(int(Config.ROLES['stvo']['pending'])))
-            await member.add_roles(member.guild.get_role(int(Config.ROLES['stvo']['passed'])))
-        return True
-    except:
-        return False
+def default_guild():
+    """Guild für Altdaten ohne guild_id: GUILD_ID aus der Config oder die einzige Guild des Bots."""
+    if Config.GUILD_ID:
+        return bot.get_guild(int(Config.GUILD_ID))
+    return bot.guilds[0] if len(bot.guilds) == 1 else None
+
+def resolve_guild(guild_id):
+    return bot.get_guild(int(guild_id)) if guild_id else default_guild()
+
+def migrate_legacy_guild(data):
+    """Ordnet Altdaten ohne guild_id der Guild aus default_guild() zu (im Bot-Loop).
+
+    Ohne GUILD_ID in der Config fände record_guild() für sie sonst keine
+    Guild, und sie fehlten in allen Guild-bezogenen Abfragen.
+    """
+    guild = default_guild()
+    if not guild:
+        return
+    migrated = 0
+    for key in ('announcements', 'evaluations'):
+        records = data.get(key, [])
+        legacy = sum(1 for record in records if not record.get('guild_id'))
+        if legacy:
+            # Neue Liste statt in-place: das Journal schreibt sie als Ganzes
+            data[key] = [record if record.get('guild_id') else {**record, 'guild_id': guild.id} for record in records]
+            migrated += legacy
+    for job_id, job in list(job_queue.jobs.items()):
+        if not job.get('guild_id'):
+            job_queue.jobs[job_id] = {**job, 'guild_id': str(guild.id)}
+            migrated += 1
+    if not migrated:
+        return
+    history.reset()
+    progression.rebuild()
+    log('legacy_guild_migrated', f"🏷️ {migrated} Altdaten der Guild {guild.name} zugeordnet", guild_id=guild.id, records=migrated)
+
+# ==================== NOTEN ====================
+class GradingEngine:
+    """Notenberechnung aus dem Notenspiegel ('grading') des jeweiligen Templates.
+
+    Jede Zeile wie 'Sehr gut: 50 – 45' wird einmal in eine aufsteigend
+    sortierte Liste von Untergrenzen geparst; die beste Spanne ist Note 1.
+    Der Lookup ist ein bisect, das Ergebnis wird pro Guild, Typ und
+    Template-Version gecacht (/save/<type> erhöht die Version).
+    """
+
+    RANGE_PATTERN = re.compile(r'(\d+)\s*[–—-]\s*(\d+)')
+
+    def __init__(self):
+        self._scales = {}
+
+    def scale(self, training_type, guild_id=None):
+        version = template_versions.get(training_type, 0)
+        key = (str(guild_id) if guild_configs.is_configured(guild_id) else None, training_type)
+        cached = self._scales.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        template = guild_configs.template(guild_id, training_type)
+        scale = self.parse(template.get('grading') or [])
+        if scale is None:
+            scale = self.parse(get_default_templates().get(training_type, {}).get('grading', []))
+            log('grading_invalid', f"⚠️ Notenspiegel für {training_type} ungültig - nutze Standard", level='warning', training_type=training_type, guild_id=guild_id)
+        self._scales[key] = (version, scale)
+        return scale
+
+    @classmethod
+    def parse(cls, lines):
+        ranges = []
+        for line in lines:
+            match = cls.RANGE_PATTERN.search(line)
+            if match:
+                a, b = int(match.group(1)), int(match.group(2))
+                label = line.split(':', 1)[0].strip() if ':' in line else ''
+                ranges.append((min(a, b), max(a, b), label))
+        if not ranges:
+            return None
+        # Höchste Spanne = Note 1
+        ranges.sort(key=lambda r: r[0], reverse=True)
+        graded = [(low, high, grade, label) for grade, (low, high, label) in enumerate(ranges, 1)]
+        graded.reverse()
+        lows = [r[0] for r in graded]
+        if lows[0] != 0:
+            return None
+        table = tuple(graded[bisect_right(lows, p) - 1][2] for p in range(max(r[1] for r in graded) + 1))
+        return {
+            'max_points': len(table) - 1,
+            'lows': lows,
+            'grades': [r[2] for r in graded],
+            'table': table,
+            'thresholds': [{'min': low, 'max': high, 'grade': grade, 'label': label} for low, high, grade, label in reversed(graded)]
+        }
 
-async def send_evaluation_to_channel(guild, eval_data):
-    try:
-        training_type = eval_data['training_type']
-        channel_id = int(Config.CHANNELS[training_type]['evaluation'])
-        channel = guild.get_channel(channel_id)
+    def grade(self, training_type, points, guild_id=None):
+        scale = self.scale(training_type, guild_id)
+        points = min(max(points, 0), scale['max_points'])
+        return scale['grades'][bisect_right(scale['lows'], points) - 1]
 
-        if not channel:
-            print(f"❌ Kanal nicht gefunden!")
-            return False
+    def max_points(self, training_type, guild_id=None):
+        return self.scale(training_type, guild_id)['max_points']
 
-        for entry in eval_data['entries']:
-            if entry['passed']:
-                member = guild.get_member(entry['user_id'])
-                if member:
-                    await assign_role(member, training_type)
+    def table(self, training_type, guild_id=None):
+        """Punkte -> Note als Tupel (Index = Punkte) für Massenberechnungen."""
+        return self.scale(training_type, guild_id)['table']
 
-        passed_list = [e for e in eval_data['entries'] if e['passed']]
-        failed_list = [e for e in eval_data['entries'] if not e['passed']]
+grading = GradingEngine()
 
-        training_map = {'theorie': 'Theorie', 'grund': 'Grundausbildung', 'stvo': 'StVO Grundausbildung'}
-        training_name = training_map.get(training_type, training_type)
-        max_points = 50 if training_type in ['theorie', 'grund'] else 25
+def get_grade_from_points(points: int, training_type: str, guild_id=None) -> int:
+    return grading.grade(training_type, points, guild_id)
 
-        msg = f"⚜️ **Auswertung der {training_name}** ⚜️\n\n**bestanden haben:**\n\n"
-        for e in passed_list:
-            msg += f"Name: <@{e['user_id']}>\nPunkte: {e['points']}/{max_points}\nNote: {e['grade']}\nDatum: {datetime.now().strftime('%d.%m.%Y')}\n\n"
+def grade_entries(training_type: str, rows, guild_id=None) -> tuple:
+    """Validiert einen Strom von (Zeile, Datensatz) und benotet alle Einträge in einem Durchlauf.
 
-        if failed_list:
-            msg += "**Nicht Bestanden Haben:**\n\n"
-            for e in failed_list:
-                msg += f"Name: <@{e['user_id']}>\nPunkte: {e['points']}/{max_points}\nNote: {e['grade']}\nDatum: {datetime.now().strftime('%d.%m.%Y')}\n\n"
+    Gibt (entries, errors) zurück; doppelte User-IDs gelten als Fehler.
+    """
+    table = grading.table(training_type, guild_id)
+    max_points = len(table) - 1
+    user_ids, points, errors, seen = [], [], [], set()
+    for line, row in rows:
+        try:
+            user_id = int(str(row.get('user_id', '')).strip().strip('<@!>'))
+            value = int(str(row.get('points', '')).strip())
+        except (TypeError, ValueError, AttributeError):
+            errors.append(f"Zeile {line}: user_id/points ungültig")
+            continue
+        if not 0 <= value <= max_points:
+            errors.append(f"Zeile {line}: Punkte außerhalb 0-{max_points}")
+            continue
+        if user_id in seen:
+            errors.append(f"Zeile {line}: User {user_id} doppelt")
+            continue
+        seen.add(user_id)
+        user_ids.append(user_id)
+        points.append(value)
+
+    grades = [table[p] for p in points]
+    entries = [{'user_id': u, 'points': p, 'grade': g, 'passed': g <= 4} for u, p, g in zip(user_ids, points, grades)]
+    return entries, errors
+
+def iter_import_rows(stream, filename: str):
+    """Liest eine hochgeladene CSV (Spalten user_id, points) zeilenweise oder eine JSON-Liste."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if filename.lower().endswith('.json'):
+        data = json.load(text)
+        rows = data.get('entries', []) if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise ValueError("JSON muss eine Liste von Teilnehmern enthalten")
+        for i, row in enumerate(rows, 1):
+            yield i, row if isinstance(row, dict) else {}
+        return
+    reader = csv.DictReader(text)
+    for row in reader:
+        yield reader.line_num, row
+
+# Rollenwechsel nach bestandener Ausbildung: (entfernen, hinzufügen)
+ROLE_PROGRESSION = {
+    'theorie': ([('theorie', 'pending')], [('theorie', 'passed'), ('grund', 'pending')]),
+    'grund': ([('grund', 'pending')], [('grund', 'passed'), ('stvo', 'pending')]),
+    'stvo': ([('stvo', 'pending')], [('stvo', 'passed')])
+}
+ROLE_CONCURRENCY = int(os.getenv('ROLE_CONCURRENCY', 5))
+
+def compute_roles(member: discord.Member, training_type: str) -> list:
+    """Berechnet die endgültige Rollenliste eines Mitglieds nach bestandener Ausbildung."""
+    remove, add = ROLE_PROGRESSION[training_type]
+    role_ids = {r.id for r in member.roles if not r.is_default()}
+    role_ids -= {int(guild_configs.role_id(member.guild.id, t, k)) for t, k in remove}
+    role_ids |= {int(guild_configs.role_id(member.guild.id, t, k)) for t, k in add}
+    return [role for role in (member.guild.get_role(rid) for rid in role_ids) if role]
+
+async def assign_role(member: discord.Member, training_type: str) -> str:
+    """Setzt alle Rollen mit einem einzigen PATCH. Gibt 'ok', 'unchanged' oder den Fehler zurück."""
+    roles = compute_roles(member, training_type)
+    if {r.id for r in roles} == {r.id for r in member.roles if not r.is_default()}:
+        metrics.inc('bot_role_updates_total', result='unchanged')
+        return 'unchanged'
+    started = time.perf_counter()
+    try:
+        await member.edit(roles=roles, reason=f'Ausbildung bestanden: {training_type}')
+        result = 'ok'
+    except discord.Forbidden:
+        result = 'error: keine Berechtigung'
+    except discord.HTTPException as e:
+        result = f'error: HTTP {e.status}'
+    metrics.observe('bot_role_assignment_seconds', time.perf_counter() - started)
+    metrics.inc('bot_role_updates_total', result='ok' if result == 'ok' else 'error')
+    return result
+
+async def apply_role_updates(guild, training_type: str, entries: list) -> dict:
+    """Vergibt die Rollen aller bestandenen Teilnehmer parallel.
+
+    Die Semaphore begrenzt gleichzeitige Requests; das Route-Bucket-Handling
+    (inkl. 429/Retry-After) übernimmt discord.py. Das Ergebnis steht pro
+    Teilnehmer in `entry['role_update']`.
+    """
+    semaphore = asyncio.Semaphore(ROLE_CONCURRENCY)
+
+    async def update(entry):
+        if entry.get('role_update') in ('ok', 'unchanged'):
+            return  # bereits in einem früheren Versuch erledigt
+        member = guild.get_member(entry['user_id'])
+        if not member:
+            entry['role_update'] = 'error: Mitglied nicht gefunden'
+            return
+        async with semaphore:
+            entry['role_update'] = await assign_role(member, training_type)
+
+    await asyncio.gather(*(update(e) for e in entries if e['passed']))
+    summary = {}
+    for e in entries:
+        if 'role_update' in e:
+            status = 'error' if e['role_update'].startswith('error') else e['role_update']
+            summary[status] = summary.get(status, 0) + 1
+    return summary
+
+# ==================== AUSWERTUNGS-NACHRICHTEN ====================
+DISCORD_MESSAGE_LIMIT = 2000
+TRAINING_NAMES = {'theorie': 'Theorie', 'grund': 'Grundausbildung', 'stvo': 'StVO Grundausbildung'}
+
+def discord_len(text: str) -> int:
+    """Länge wie Discord sie zählt (UTF-16-Einheiten, Emojis zählen doppelt)."""
+    return len(text.encode('utf-16-le')) // 2
+
+def chunk_blocks(blocks, limit=DISCORD_MESSAGE_LIMIT) -> list:
+    """Fasst Blöcke zu möglichst wenigen Nachrichten <= limit zusammen.
+
+    Getrennt wird nur zwischen Blöcken; nur ein einzelner Block über dem
+    Limit wird hart geteilt.
+    """
+    parts, current, size = [], [], 0
+    for block in blocks:
+        length = discord_len(block)
+        if length > limit:
+            pieces = []
+            while block:
+                cut = limit
+                while discord_len(block[:cut]) > limit:
+                    cut -= 1
+                pieces.append(block[:cut])
+                block = block[cut:]
         else:
-            msg += "**Nicht Bestanden Haben:**\n\nKeiner 🎉\n\n"
+            pieces = [block]
+        for piece in pieces:
+            length = discord_len(piece)
+            if current and size + length > limit:
+                parts.append(''.join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += length
+    if current:
+        parts.append(''.join(current))
+    return parts
+
+def build_evaluation_messages(training_type, entries, max_points, date, limit=DISCORD_MESSAGE_LIMIT) -> list:
+    """Rendert die Auswertung und teilt sie an Teilnehmergrenzen in Nachrichten <= limit."""
+    def entry_block(e):
+        return f"Name: <@{e['user_id']}>\nPunkte: {e['points']}/{max_points}\nNote: {e['grade']}\nDatum: {date}\n\n"
+
+    passed = [entry_block(e) for e in entries if e['passed']]
+    failed = [entry_block(e) for e in entries if not e['passed']]
+    training_name = TRAINING_NAMES.get(training_type, training_type)
+
+    # Überschriften hängen am ersten Eintrag, damit sie nie allein am Ende einer Nachricht stehen
+    blocks = [f"⚜️ **Auswertung der {training_name}** ⚜️\n\n**bestanden haben:**\n\n" + (passed[0] if passed else '')]
+    blocks.extend(passed[1:])
+    blocks.append("**Nicht Bestanden Haben:**\n\n" + (failed[0] if failed else "Keiner 🎉\n\n"))
+    blocks.extend(failed[1:])
+    blocks.append("Eure Ausbilder wünschen euch alles gute!\nÜber ein 🔥 - Feedback würden wir uns freuen!\n\nMfg\nDas Ausbilderteam\n@Ausbilder")
+    return chunk_blocks(blocks, limit)
+
+SEND_ATTEMPTS = 3
+
+async def send_with_retry(channel, content, kind='evaluation', **kwargs):
+    """Sendet eine Nachricht; Serverfehler werden mit Backoff wiederholt (429 regelt discord.py)."""
+    for attempt in range(SEND_ATTEMPTS):
+        try:
+            with metrics.timer('bot_channel_send_seconds', kind=kind):
+                return await channel.send(content, **kwargs)
+        except discord.HTTPException as e:
+            if e.status < 500 or attempt == SEND_ATTEMPTS - 1:
+                raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == SEND_ATTEMPTS - 1:
+                raise
+        await asyncio.sleep(retry_delay(attempt))
+
+async def send_evaluation_to_channel(guild, eval_data, steps=None, checkpoint=None):
+    """Führt eine Auswertung in Schritten aus: Rollen, Nachrichten, Historie.
+
+    `steps` hält den Fortschritt und wird nach jedem Schritt über
+    `checkpoint()` gespeichert; ein erneuter Versuch überspringt erledigte
+    Schritte und bereits gesendete Nachrichtenteile. Fehler werden als
+    Exception an den Aufrufer weitergegeben.
+    """
+    steps = {} if steps is None else steps
+    save = checkpoint or (lambda: None)
+    training_type = eval_data['training_type']
+    channel_id = int(guild_configs.channel_id(guild.id, training_type, 'evaluation'))
+    channel = guild.get_channel(channel_id)
+
+    if not channel:
+        raise RuntimeError("Auswertungskanal nicht gefunden")
+
+    if not steps.get('roles'):
+        summary = await apply_role_updates(guild, training_type, eval_data['entries'])
+        log('roles_applied', f"🎖️ Rollen: {summary}", guild_id=guild.id, training_type=training_type, summary=summary)
+        steps['roles'] = True
+        save()
+
+    # Datum und Punktmaximum festhalten, damit die Aufteilung bei einem neuen Versuch identisch bleibt
+    if 'date' not in steps:
+        steps['date'] = datetime.now().strftime('%d.%m.%Y')
+        steps['max_points'] = grading.max_points(training_type, guild.id)
+    messages = build_evaluation_messages(training_type, eval_data['entries'], steps['max_points'], steps['date'])
+    for index in range(steps.get('messages_sent', 0), len(messages)):
+        await send_with_retry(channel, messages[index])
+        steps['messages_sent'] = index + 1
+        save()
+
+    if not steps.get('recorded'):
+        now = datetime.now()
+        record = {
+            'type': training_type,
+            'guild_id': guild.id,
+            'entries': eval_data['entries'],
+            'host': eval_data.get('host'),
+            'timestamp': int(now.timestamp()),
+            'created_at': now.isoformat()
+        }
+        history.add_evaluation(record)
+        progression.record_evaluation(record)
+        steps['recorded'] = True
+        save()
+
+    log('evaluation_sent', "✅ Auswertung gesendet!", guild_id=guild.id, training_type=training_type, entries=len(eval_data['entries']))
+
+# ==================== EMBED-CACHE ====================
+REACTION_EMOJI_ID = int(Config.REACTION_EMOJI.split(':')[-1].rstrip('>'))
+
+class GuildObjectCache:
+    """Pro Guild einmal aufgelöste Emojis und Rollen (invalidiert durch Gateway-Events)."""
+
+    def __init__(self):
+        self._emojis = {}
+        self._roles = {}
+
+    def emoji(self, guild, emoji_id):
+        key = (guild.id, emoji_id)
+        if key not in self._emojis:
+            self._emojis[key] = discord.utils.get(guild.emojis, id=emoji_id)
+        return self._emojis[key]
+
+    def role(self, guild, role_id):
+        key = (guild.id, int(role_id))
+        if key not in self._roles:
+            self._roles[key] = guild.get_role(int(role_id))
+        return self._roles[key]
+
+    def invalidate(self, guild_id, emojis=False, roles=False):
+        if emojis:
+            self._emojis = {k: v for k, v in self._emojis.items() if k[0] != guild_id}
+        if roles:
+            self._roles = {k: v for k, v in self._roles.items() if k[0] != guild_id}
+
+class AnnouncementEmbedCache:
+    """Fertig gerenderte Ankündigungs-Embeds (als Dict) ohne die Termin-Zeile.
+
+    Schlüssel ist (Guild, Typ); ein Eintrag gilt, solange seine Version der
+    Template-Version entspricht, die /save/<type> erhöht.
+    """
+
+    def __init__(self):
+        self._skeletons = {}
+
+    def get(self, guild, typ):
+        version = template_versions.get(typ, 0)
+        cached = self._skeletons.get((guild.id, typ))
+        if cached and cached[0] == version:
+            return cached[1]
+        embed = build_announcement_skeleton(guild, typ)
+        self._skeletons[(guild.id, typ)] = (version, embed)
+        return embed
+
+    def invalidate(self, guild_id):
+        self._skeletons = {k: v for k, v in self._skeletons.items() if k[0] != guild_id}
+
+guild_objects = GuildObjectCache()
+announcement_embeds = AnnouncementEmbedCache()
+
+def build_announcement_skeleton(guild, typ):
+    template = guild_configs.template(guild.id, typ)
+    passed_role = guild_objects.role(guild, guild_configs.role_id(guild.id, typ, 'passed'))
+
+    embed = discord.Embed(title=template['title'], description=template['intro'], color=0x02244b)
+    embed.add_field(name="**Themen:**", value="\n".join(f"> - {t}" for t in template['topics']), inline=False)
+
+    if template.get('additional_info'):
+        embed.add_field(name="**Zusätzliche Informationen:**", value="\n".join(f"> - {i}" for i in template['additional_info']), inline=False)
+
+    if template.get('grading'):
+        embed.add_field(name="**Notenspiegel:**", value="\n".join(f"> - {g}" for g in template['grading']), inline=False)
+
+    if template.get('benefits'):
+        benefits = "\n".join(f"> - {b}" for b in template['benefits'])
+        benefits = benefits.replace('{passed_role}', passed_role.mention if passed_role else '✅')
+        embed.add_field(name="**Vorteile:**", value=benefits, inline=False)
+
+    if typ in Config.BANNERS:
+        embed.set_image(url=Config.BANNERS[typ])
+    return embed.to_dict()
+
+def build_announcement_embed(guild, typ, timestamp, host_mention):
+    """Baut das Embed aus dem gecachten Skelett; neu sind nur Termin und Veranstalter."""
+    skeleton = announcement_embeds.get(guild, typ)
+    info = {'name': '', 'value': f"📅 **Datum:** <t:{timestamp}:D>\n🕐 **Uhrzeit:** <t:{timestamp}:t>\n⏱️ **Dauer:** ca. 45-90 Min\n\n👤 **Veranstalter:** {host_mention}", 'inline': False}
+    # Embed.copy() ist flach - die Feldliste deshalb neu zusammensetzen statt einfügen
+    return discord.Embed.from_dict({**skeleton, 'fields': [info, *skeleton.get('fields', [])]})
+
+@bot.event
+async def on_guild_emojis_update(guild, before, after):
+    guild_objects.invalidate(guild.id, emojis=True)
 
-        msg += "Eure Ausbilder wünschen euch alles gute!\nÜber ein 🔥 - Feedback würden wir uns freuen!\n\nMfg\nDas Ausbilderteam\n@Ausbilder"
+@bot.event
+async def on_guild_role_update(before, after):
+    guild_objects.invalidate(after.guild.id, roles=True)
+    announcement_embeds.invalidate(after.guild.id)
 
-        await channel.send(msg)
+@bot.event
+async def on_guild_role_delete(role):
+    guild_objects.invalidate(role.guild.id, roles=True)
+    announcement_embeds.invalidate(role.guild.id)
 
-        bot_data['evaluations'].append({
-            'type': training_type,
-            'entries': eval_data['entries'],
+@bot.event
+async def on_guild_role_create(role):
+    guild_objects.invalidate(role.guild.id, roles=True)
+
+async def post_announcement(guild, typ, datum, uhrzeit, timestamp, host_id, steps=None, checkpoint=None):
+    """Sendet eine Ankündigung, fügt die Reaktion hinzu, speichert sie und plant Erinnerungen.
+
+    Wie bei send_evaluation_to_channel halten `steps`/`checkpoint()` den
+    Fortschritt fest: ein erneuter Versuch sendet eine bereits gepostete
+    Ankündigung nicht noch einmal und legt Anmeldung, Historie und
+    Erinnerungen nur einmal an.
+    """
+    steps = {} if steps is None else steps
+    save = checkpoint or (lambda: None)
+    channel = guild.get_channel(int(guild_configs.channel_id(guild.id, typ, 'announcement')))
+    if not channel:
+        raise RuntimeError("Kanal nicht gefunden!")
+
+    if not steps.get('posted'):
+        pending_role = guild_objects.role(guild, guild_configs.role_id(guild.id, typ, 'pending'))
+        embed = build_announcement_embed(guild, typ, timestamp, f'<@{host_id}>')
+        with metrics.timer('bot_channel_send_seconds', kind='announcement'):
+            message = await channel.send(content=pending_role.mention if pending_role else "@everyone", embed=embed, allowed_mentions=discord.AllowedMentions(roles=True))
+        steps['posted'] = True
+        steps['message_id'] = str(message.id)
+        save()
+    else:
+        message = channel.get_partial_message(int(steps['message_id']))
+
+    if not steps.get('recorded'):
+        # Reaktion läuft als Task, während die Buchhaltung (Write-behind) erledigt wird
+        reaction = asyncio.create_task(add_signup_reaction(guild, message))
+        signups.track(message.id, typ, guild.id, channel.id, timestamp)
+        history.add_announcement({
+            'type': typ,
+            'guild_id': guild.id,
+            'date': datum,
+            'time': uhrzeit,
+            'timestamp': timestamp,
+            'host': host_id,
+            'message_id': str(message.id),
+            'channel_id': str(channel.id),
             'created_at': datetime.now().isoformat()
         })
-        save_data(bot_data)
+        schedule_reminders(guild.id, typ, timestamp, channel.id, message.id)
+        steps['recorded'] = True
+        save()
+        await reaction
+    return channel, message
+
+async def add_signup_reaction(guild, message):
+    """Fügt die Anmelde-Reaktion hinzu; ein Fehler (z.B. fehlende Berechtigung) wird nur geloggt."""
+    emoji = guild_objects.emoji(guild, REACTION_EMOJI_ID)
+    try:
+        try:
+            await message.add_reaction(emoji if emoji else '📝')
+        except discord.HTTPException:
+            if not emoji:
+                raise
+            await message.add_reaction('📝')
+    except discord.HTTPException as e:
+        log('signup_reaction_failed', f"⚠️ Anmelde-Reaktion konnte nicht hinzugefügt werden: {e}", level='warning', guild_id=guild.id, message_id=message.id, error=str(e))
+
+# ==================== ZEITPLANER ====================
+REMINDER_OFFSETS = tuple(int(m) * 60 for m in os.getenv('REMINDER_MINUTES', '60,10').split(',') if m.strip())
+
+class Scheduler:
+    """Zeitgesteuerte Ereignisse (geplante Ankündigungen, Erinnerungen).
+
+    Die Ereignisse liegen in bot_data['scheduled'] (ID -> Eintrag) und werden
+    beim Start wiederhergestellt. Im Bot-Loop hält ein Min-Heap (Fälligkeit, ID)
+    die Reihenfolge; der Runner schläft bis zur nächsten Deadline und wird
+    bei neuen Einträgen geweckt. Einfügen und Entnehmen kosten O(log n),
+    gelöschte Einträge werden beim Entnehmen übersprungen.
+
+    Fällige Ereignisse werden als Job 'scheduled' an die job_queue übergeben
+    und erst dabei aus `events` entfernt - beides im selben Loop-Schritt,
+    also im selben Speicherstand. Ausgeführt werden sie dort mit Backoff und
+    landen nach JOB_MAX_ATTEMPTS in der Dead-Letter-Liste.
+    """
+
+    MAX_SLEEP = 300  # Sekunden; begrenzt Drift bei Uhrzeit-Korrekturen
+
+    def __init__(self, data):
+        self.data = data
+        data.setdefault('scheduled', {})
+        self._heap = [(event['due'], event_id) for event_id, event in self.events.items()]
+        heapq.heapify(self._heap)
+        self._handlers = {}
+        self._lock = Lock()
+        self._loop = None
+        self._wakeup = None
+
+    @property
+    def events(self):
+        return self.data['scheduled']
+
+    @property
+    def running(self):
+        return self._loop is not None
+
+    def handler(self, kind):
+        def register(func):
+            self._handlers[kind] = func
+            return func
+        return register
+
+    def schedule(self, kind, due, payload, key=None):
+        """Plant ein Ereignis zur Unix-Zeit `due`. Darf aus jedem Thread aufgerufen werden.
+
+        Mit `key` (z.B. Bus-Nachricht) wird das Ereignis nur einmal angelegt,
+        auch wenn es bereits fällig war und an die job_queue übergeben wurde.
+        """
+        event_id = key or new_ulid()
+        if key and (event_id in self.events or job_queue.known(f'scheduled:{event_id}')):
+            return event_id
+        self.events[event_id] = {'kind': kind, 'due': due, 'payload': payload}
+        persister.mark_dirty()
+        with self._lock:
+            loop = self._loop
+            if loop is None:
+                heapq.heappush(self._heap, (due, event_id))
+                return event_id
+        loop.call_soon_threadsafe(self._push, due, event_id)
+        return event_id
+
+    def _push(self, due, event_id):
+        heapq.heappush(self._heap, (due, event_id))
+        if self._heap[0][1] == event_id:
+            self._wakeup.set()
+
+    def upcoming(self, limit=50):
+        return sorted(({'id': event_id, **event} for event_id, event in list(self.events.items())), key=lambda e: e['due'])[:limit]
+
+    async def run(self):
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+        while not bot.is_closed():
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, event_id = heapq.heappop(self._heap)
+                event = self.events.get(event_id)
+                if event is None:
+                    continue
+                # Der Schlüssel verhindert eine doppelte Übergabe, falls der Bot vor dem Speichern abstürzt
+                job_queue.submit('scheduled', {'id': event_id, **event}, key=f'scheduled:{event_id}', guild_id=event['payload'].get('guild_id'))
+                del self.events[event_id]
+                persister.mark_dirty()
+
+            timeout = min(self._heap[0][0] - now, self.MAX_SLEEP) if self._heap else self.MAX_SLEEP
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def execute(self, event, steps=None, checkpoint=None):
+        """Führt ein fälliges Ereignis aus (Job 'scheduled'); Fehler gehen an die job_queue.
+
+        `steps`/`checkpoint` reichen den Fortschritt des Jobs an den Handler weiter.
+        """
+        handler = self._handlers.get(event['kind'])
+        if not handler:
+            raise RuntimeError(f"Unbekanntes Ereignis {event['kind']}")
+        await handler(event['payload'], {} if steps is None else steps, checkpoint or (lambda: None))
+
+scheduler = Scheduler(bot_data)
+
+def schedule_reminders(guild_id, typ, timestamp, channel_id, message_id):
+    now = time.time()
+    for offset in REMINDER_OFFSETS:
+        if timestamp - offset > now:
+            scheduler.schedule('reminder', timestamp - offset, {'guild_id': guild_id, 'type': typ, 'timestamp': timestamp, 'channel_id': channel_id, 'message_id': message_id}, key=f'reminder:{message_id}:{offset}')
+
+@scheduler.handler('announcement')
+async def run_scheduled_announcement(payload, steps, checkpoint):
+    guild = resolve_guild(payload.get('guild_id'))
+    if not guild:
+        raise RuntimeError("Keine Guild verfügbar")
+    channel, _ = await post_announcement(guild, payload['type'], payload['date'], payload['time'], payload['timestamp'], payload['host'], steps, checkpoint)
+    log('scheduled_announcement_sent', f"📢 Geplante Ankündigung gesendet in #{channel.name}", guild_id=guild.id, channel_id=channel.id)
+
+@scheduler.handler('reminder')
+async def run_reminder(payload, steps, checkpoint):
+    guild = resolve_guild(payload.get('guild_id'))
+    channel = guild.get_channel(int(payload['channel_id'])) if guild else None
+    if not channel:
+        raise RuntimeError("Kanal nicht gefunden")
+    pending_role = guild_objects.role(guild, guild_configs.role_id(guild.id, payload['type'], 'pending'))
+    training_name = TRAINING_NAMES.get(payload['type'], payload['type'])
+    reference = discord.MessageReference(message_id=int(payload['message_id']), channel_id=channel.id, fail_if_not_exists=False)
+    with metrics.timer('bot_channel_send_seconds', kind='reminder'):
+        await channel.send(
+            f"⏰ {pending_role.mention if pending_role else '@everyone'} Erinnerung: Die **{training_name}** beginnt <t:{payload['timestamp']}:R>!",
+            reference=reference,
+            allowed_mentions=discord.AllowedMentions(roles=True)
+        )
+
+def is_signup_emoji(emoji):
+    if isinstance(emoji, str):
+        return emoji == '📝'
+    return emoji.id == REACTION_EMOJI_ID if emoji.id else emoji.name == '📝'
 
-        print(f"✅ Auswertung gesendet!")
-        return True
-    except Exception as e:
-        print(f"❌ Fehler: {e}")
+@bot.event
+async def on_raw_reaction_add(payload):
+    if payload.user_id != bot.user.id and is_signup_emoji(payload.emoji):
+        signups.add(payload.message_id, payload.user_id)
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    if is_signup_emoji(payload.emoji):
+        signups.remove(payload.message_id, payload.user_id)
+
+async def fetch_signup_users(entry, message_id):
+    channel = bot.get_channel(int(entry['channel_id']))
+    if not channel:
+        return None
+    message = await channel.fetch_message(int(message_id))
+    users = set()
+    for reaction in message.reactions:
+        if is_signup_emoji(reaction.emoji):
+            # reaction.users() blättert in 100er-Seiten durch die REST-API
+            users |= {str(user.id) async for user in reaction.users() if user.id != bot.user.id}
+    return users
+
+async def reconcile_signups():
+    """Gleicht offene Ankündigungen nach dem Start mit Discord ab (verpasste Events)."""
+    pending = signups.active()
+    if not pending:
+        return
+    semaphore = asyncio.Semaphore(ROLE_CONCURRENCY)
+
+    async def reconcile(entry):
+        async with semaphore:
+            try:
+                users = await fetch_signup_users(entry, entry['message_id'])
+            except discord.HTTPException as e:
+                log('signups_fetch_failed', f"❌ Anmeldungen für {entry['message_id']} nicht abrufbar: {e}", level='error', message_id=entry['message_id'], error=str(e))
+                return False
+        return users is not None and signups.replace(entry['message_id'], users)
+
+    changed = await asyncio.gather(*(reconcile(entry) for entry in pending))
+    log('signups_reconciled', f"📝 Anmeldungen abgeglichen: {len(pending)} Ankündigungen, {sum(changed)} aktualisiert", announcements=len(pending), updated=sum(changed))
+
+# ==================== LOOP-WATCHDOG ====================
+class LoopWatchdog:
+    """Erkennt Hänger des Event-Loops und profiliert langsame Handler (Config.LOOP_WATCHDOG).
+
+    Eine Task im Loop setzt alle `interval` Sekunden einen Herzschlag. Ein
+    Daemon-Thread prüft ihn im selben Takt: bleibt er länger als
+    LOOP_STALL_THRESHOLD aus, wird der Stack des Loop-Threads - also der
+    gerade blockierende Code - geloggt. Solange ein mit @profiled markierter
+    Handler läuft, zählt derselbe Thread die Stacks des Loop-Threads
+    (Wandzeit-Stichproben). Handler über SLOW_HANDLER_THRESHOLD bleiben als
+    rollierendes Profil erhalten und werden nach PROFILE_FILE geschrieben
+    (Collapsed-Stack-Format, z.B. für flamegraph.pl oder speedscope).
+    """
+
+    def __init__(self, interval=0.01, keep=20):
+        self.interval = interval
+        self.stalls = deque(maxlen=keep)
+        self.profiles = deque(maxlen=keep)
+        self._active = {}
+        self._lock = Lock()
+        self._beat = None
+        self._loop_thread = None
+        self._stalled = False
+        # Nur der Watchdog-Thread schreibt PROFILE_FILE; andere melden per Event
+        self._export_due = Event()
+
+    @property
+    def running(self):
+        return self._loop_thread is not None
+
+    def start(self, loop):
+        """Muss im Loop aufgerufen werden."""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        loop.create_task(self._heartbeat())
+        Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+        log('watchdog_started', f"🐶 Loop-Watchdog aktiv (Schwelle {Config.LOOP_STALL_THRESHOLD:.2f}s)", threshold=Config.LOOP_STALL_THRESHOLD)
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(frame):
+        stack = traceback.extract_stack(frame)
+        return ';'.join(f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}" for f in stack)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            if self._export_due.is_set():
+                self._export_due.clear()
+                self._export()
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            with self._lock:
+                active = list(self._active.values())
+            if active:
+                stack = self._collapse(frame)
+                for entry in active:
+                    entry['samples'][stack] += 1
+
+            lag = time.monotonic() - self._beat
+            if lag > Config.LOOP_STALL_THRESHOLD and not self._stalled:
+                self._stalled = True
+                stack = ''.join(traceback.format_stack(frame))
+                self.stalls.append({'at': datetime.now().isoformat(), 'lag': round(lag, 3), 'handlers': [entry['name'] for entry in active], 'stack': stack})
+                metrics.inc('bot_loop_stalls_total')
+                log('loop_stall', f"🧊 Event-Loop blockiert seit {lag:.2f}s", level='warning', lag=round(lag, 3), handlers=[entry['name'] for entry in active], stack=stack)
+                self._export_due.set()
+            elif lag <= Config.LOOP_STALL_THRESHOLD:
+                self._stalled = False
+
+    @contextmanager
+    def profile(self, name):
+        if not self.running:
+            yield
+            return
+        token = object()
+        entry = {'name': name, 'started': time.perf_counter(), 'samples': Counter()}
+        with self._lock:
+            self._active[token] = entry
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.pop(token, None)
+            duration = time.perf_counter() - entry['started']
+            metrics.observe('bot_handler_seconds', duration, handler=name)
+            if duration >= Config.SLOW_HANDLER_THRESHOLD:
+                self.profiles.append({'handler': name, 'at': datetime.now().isoformat(), 'duration': round(duration, 3), 'samples': dict(entry['samples'])})
+                log('slow_handler', f"🐢 {name} brauchte {duration:.2f}s", level='warning', handler=name, duration=round(duration, 3))
+                # Keine Datei-I/O im Loop - der Watchdog-Thread schreibt beim nächsten Takt
+                self._export_due.set()
+
+    def export(self):
+        """Profile und Hänger als Text; Stack-Zeilen im Collapsed-Format 'a;b;c Anzahl'."""
+        lines = []
+        for profile in list(self.profiles):
+            lines.append(f"# {profile['handler']} {profile['at']} {profile['duration']}s")
+            lines.extend(f"{profile['handler']};{stack} {count}" for stack, count in sorted(profile['samples'].items(), key=lambda item: -item[1]))
+        for stall in list(self.stalls):
+            lines.append(f"# stall {stall['at']} {stall['lag']}s handlers={','.join(stall['handlers']) or '-'}")
+            lines.extend(f"#   {line}" for line in stall['stack'].rstrip().splitlines())
+        return '\n'.join(lines) + '\n'
+
+    def _export(self):
+        # Datei statt Speicher, damit auch ein getrennter Web-Prozess sie ausliefern kann
+        tmp = f'{Config.PROFILE_FILE}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(self.export())
+            os.replace(tmp, Config.PROFILE_FILE)
+        except OSError as e:
+            log('profile_write_failed', f"❌ Profil nicht gespeichert: {e}", level='error', error=str(e))
+
+watchdog = LoopWatchdog()
+metrics.describe('bot_handler_seconds', 'histogram', 'Dauer profilierter Handler (nur mit LOOP_WATCHDOG)')
+metrics.describe('bot_loop_stalls_total', 'counter', 'Erkannte Event-Loop-Hänger')
+
+def profiled(name):
+    """Markiert einen async Handler für das Stichproben-Profil des Watchdogs."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with watchdog.profile(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ==================== INTERAKTIONEN ====================
+metrics.describe('bot_interaction_ack_seconds', 'histogram', 'Dauer der Bestätigung (defer) einer Interaktion')
+metrics.describe('bot_interaction_expired_total', 'counter', 'Interaktionen, die Discord bei der Bestätigung nicht mehr kannte')
+
+async def defer_interaction(interaction, command):
+    """Bestätigt eine Interaktion sofort ("denkt nach..."), bevor langsame Arbeit beginnt.
+
+    Der Aufruf wird nie abgebrochen - ein abgebrochenes defer() kann bei
+    Discord trotzdem angekommen sein, und der Nutzer sähe "denkt nach..." für
+    immer. Die Dauer wird gemessen, über INTERACTION_ACK_DEADLINE gewarnt.
+    Gibt False zurück, wenn Discord die Interaktion nicht mehr kennt; die
+    Arbeit soll trotzdem erledigt werden, nur die Antwort entfällt.
+    """
+    started = time.monotonic()
+    try:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+    except discord.NotFound as e:
+        metrics.inc('bot_interaction_expired_total', command=command)
+        log('interaction_expired', f"⌛ /{command} nicht mehr bestätigbar - wird trotzdem ausgeführt", level='warning', command=command, error=str(e))
         return False
+    elapsed = time.monotonic() - started
+    metrics.observe('bot_interaction_ack_seconds', elapsed, command=command)
+    if elapsed > Config.INTERACTION_ACK_DEADLINE:
+        log('interaction_ack_slow', f"🐢 /{command} erst nach {elapsed:.2f}s bestätigt", level='warning', command=command, duration=round(elapsed, 3))
+    return True
+
+async def reply(interaction, content):
+    """Antwortet ephemeral - als Followup, falls die Interaktion schon bestätigt ist."""
+    try:
+        if interaction.response.is_done():
+            await interaction.followup.send(content, ephemeral=True)
+        else:
+            await interaction.response.send_message(content, ephemeral=True)
+    except discord.NotFound:
+        # Interaktion verfallen - das Ergebnis steht nur noch im Log
+        log('interaction_reply_lost', f"⌛ Antwort nicht zustellbar: {content}", level='warning', content=content)
 
 class EvaluationButton(discord.ui.View):
     def __init__(self, eval_url: str):
@@ -587,69 +2579,32 @@ class EvaluationButton(discord.ui.View):
         self.add_item(discord.ui.Button(label="Zur Auswertung", url=eval_url, style=discord.ButtonStyle.link))
 
 @bot.tree.command(name="ausbildung_ankündigen", description="Kündige eine Ausbildung an")
-@app_commands.describe(typ="Typ", datum="TT.MM.JJJJ", uhrzeit="HH:MM", veranstalter="Veranstalter")
-async def announce(interaction: discord.Interaction, typ: Literal['theorie', 'grund', 'stvo'], datum: str, uhrzeit: str, veranstalter: discord.Member):
+@app_commands.describe(typ="Typ", datum="TT.MM.JJJJ", uhrzeit="HH:MM", veranstalter="Veranstalter", veroeffentlichen="Optional: Ankündigung erst am TT.MM.JJJJ HH:MM senden")
+@profiled('announce')
+async def announce(interaction: discord.Interaction, typ: Literal['theorie', 'grund', 'stvo'], datum: str, uhrzeit: str, veranstalter: discord.Member, veroeffentlichen: str = None):
     if not interaction.user.guild_permissions.manage_messages:
         return await interaction.response.send_message("❌ Keine Berechtigung", ephemeral=True)
 
     try:
         dt = datetime.strptime(f"{datum} {uhrzeit}", "%d.%m.%Y %H:%M")
         timestamp = int(dt.timestamp())
-        template = bot_data['templates'][typ]
-
-        channel_id = int(Config.CHANNELS[typ]['announcement'])
-        channel = interaction.guild.get_channel(channel_id)
-
-        if not channel:
-            return await interaction.response.send_message("❌ Kanal nicht gefunden!", ephemeral=True)
-
-        pending_role = interaction.guild.get_role(int(Config.ROLES[typ]['pending']))
-        passed_role = interaction.guild.get_role(int(Config.ROLES[typ]['passed']))
-
-        embed = discord.Embed(title=template['title'], description=template['intro'], color=0x02244b)
-        embed.add_field(name="", value=f"📅 **Datum:** <t:{timestamp}:D>\n🕐 **Uhrzeit:** <t:{timestamp}:t>\n⏱️ **Dauer:** ca. 45-90 Min\n\n👤 **Veranstalter:** {veranstalter.mention}", inline=False)
-        embed.add_field(name="**Themen:**", value="\n".join(f"> - {t}" for t in template['topics']), inline=False)
-
-        if template.get('additional_info'):
-            embed.add_field(name="**Zusätzliche Informationen:**", value="\n".join(f"> - {i}" for i in template['additional_info']), inline=False)
-
-        if template.get('grading'):
-            embed.add_field(name="**Notenspiegel:**", value="\n".join(f"> - {g}" for g in template['grading']), inline=False)
-
-        if template.get('benefits'):
-            benefits = "\n".join(f"> - {b}" for b in template['benefits'])
-            benefits = benefits.replace('{passed_role}', passed_role.mention if passed_role else '✅')
-            embed.add_field(name="**Vorteile:**", value=benefits, inline=False)
-
-        if typ in Config.BANNERS:
-            embed.set_image(url=Config.BANNERS[typ])
-
-        message = await channel.send(content=pending_role.mention if pending_role else "@everyone", embed=embed, allowed_mentions=discord.AllowedMentions(roles=True))
 
-        try:
-            emoji_id = Config.REACTION_EMOJI.split(':')[-1].rstrip('>')
-            emoji = discord.utils.get(interaction.guild.emojis, id=int(emoji_id))
-            await message.add_reaction(emoji if emoji else '📝')
-        except:
-            await message.add_reaction('📝')
+        if veroeffentlichen:
+            due = int(datetime.strptime(veroeffentlichen, "%d.%m.%Y %H:%M").timestamp())
+            scheduler.schedule('announcement', due, {'guild_id': interaction.guild.id, 'type': typ, 'date': datum, 'time': uhrzeit, 'timestamp': timestamp, 'host': veranstalter.id})
+            return await interaction.response.send_message(f"🗓️ Ankündigung geplant für <t:{due}:f>!", ephemeral=True)
 
-        await interaction.response.send_message(f"✅ Gesendet in {channel.mention}!", ephemeral=True)
-
-        bot_data['announcements'].append({
-            'type': typ,
-            'date': datum,
-            'time': uhrzeit,
-            'timestamp': timestamp,
-            'host': veranstalter.id,
-            'created_at': datetime.now().isoformat()
-        })
-        save_data(bot_data)
+        # Erst bestätigen, dann senden - Kanal-API und Reaktion können die 3 Sekunden überschreiten
+        await defer_interaction(interaction, 'announce')
+        channel, _ = await post_announcement(interaction.guild, typ, datum, uhrzeit, timestamp, veranstalter.id)
+        await reply(interaction, f"✅ Gesendet in {channel.mention}!")
     except ValueError:
-        await interaction.response.send_message("❌ Ungültiges Format!", ephemeral=True)
+        await reply(interaction, "❌ Ungültiges Format!")
     except Exception as e:
-        await interaction.response.send_message(f"❌ Fehler: {str(e)}", ephemeral=True)
+        await reply(interaction, f"❌ Fehler: {str(e)}")
 
 @bot.tree.command(name="auswertung", description="Auswertung über Web-Portal erstellen")
+@profiled('evaluate')
 async def evaluate(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.manage_messages:
         return await interaction.response.send_message("❌ Keine Berechtigung", ephemeral=True)
@@ -659,7 +2614,7 @@ async def evaluate(interaction: discord.Interaction):
     if not base_url.startswith('http'):
         base_url = 'https://' + base_url
 
-    print(f"📍 Auswertungs-URL: {base_url}")
+    log('evaluation_url', f"📍 Auswertungs-URL: {base_url}", url=base_url)
 
     view = EvaluationButton(base_url)
 
@@ -672,82 +2627,306 @@ async def evaluate(interaction: discord.Interaction):
 
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
+@bot.tree.command(name="fortschritt", description="Zeigt den Ausbildungsstand eines Mitglieds")
+@app_commands.describe(mitglied="Mitglied (leer = du selbst)")
+async def show_progress(interaction: discord.Interaction, mitglied: discord.Member = None):
+    mitglied = mitglied or interaction.user
+    if mitglied.id != interaction.user.id and not interaction.user.guild_permissions.manage_messages:
+        return await interaction.response.send_message("❌ Keine Berechtigung", ephemeral=True)
+
+    record = progression.get(mitglied.id, interaction.guild.id)
+    if not record:
+        return await interaction.response.send_message(f"ℹ️ Für {mitglied.mention} gibt es noch keine Auswertungen.", ephemeral=True)
+
+    embed = discord.Embed(title=f"📈 Ausbildungsstand von {mitglied.display_name}", color=0x02244b)
+    embed.add_field(name="Aktuelle Stufe", value=STAGE_NAMES.get(record['stage'], record['stage']), inline=False)
+    for stage in STAGES:
+        if stage in record['attempts']:
+            embed.add_field(name=STAGE_NAMES[stage], value=f"Versuche: {record['attempts'][stage]}\nBeste Punktzahl: {record['best'].get(stage, '-')}", inline=True)
+    last = record['last']
+    if last:
+        embed.add_field(name="Letztes Ergebnis", value=f"{STAGE_NAMES.get(last['type'], last['type'])}: {last['points']} Punkte, Note {last['grade']} ({'bestanden' if last['passed'] else 'nicht bestanden'}) <t:{last['timestamp']}:D>", inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="fortschritt_neu_aufbauen", description="Baut den Ausbildungsfortschritt aller Azubis aus dem Auswertungsverlauf neu auf")
+async def rebuild_progress(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_guild:
+        return await interaction.response.send_message("❌ Keine Berechtigung", ephemeral=True)
+
+    trainees = progression.rebuild()
+    log('progression_rebuilt', f"📈 Fortschritt neu aufgebaut: {trainees} Azubis", user_id=interaction.user.id, trainees=trainees)
+    await interaction.response.send_message(f"✅ Fortschritt aus dem Verlauf neu aufgebaut ({trainees} Azubis)", ephemeral=True)
+
+@bot.tree.command(name="konfigurieren", description="Kanäle und Rollen einer Ausbildung für diesen Server festlegen")
+@app_commands.describe(typ="Typ", ankuendigung="Kanal für Ankündigungen", auswertung="Kanal für Auswertungen", ausstehend="Rolle: Ausbildung ausstehend", bestanden="Rolle: Ausbildung bestanden")
+async def configure_training(interaction: discord.Interaction, typ: Literal['theorie', 'grund', 'stvo'], ankuendigung: discord.TextChannel, auswertung: discord.TextChannel, ausstehend: discord.Role, bestanden: discord.Role):
+    if not interaction.user.guild_permissions.manage_guild:
+        return await interaction.response.send_message("❌ Keine Berechtigung", ephemeral=True)
+
+    guild_configs.configure(
+        interaction.guild.id, typ, name=interaction.guild.name,
+        roles={'pending': str(ausstehend.id), 'passed': str(bestanden.id)},
+        channels={'announcement': str(ankuendigung.id), 'evaluation': str(auswertung.id)}
+    )
+    announcement_embeds.invalidate(interaction.guild.id)
+    await interaction.response.send_message(f"✅ {TRAINING_NAMES.get(typ, typ)}: Ankündigungen in {ankuendigung.mention}, Auswertungen in {auswertung.mention}", ephemeral=True)
+
+@bot.tree.command(name="team_rollen", description="Rollen mit Zugriff auf das Web-Portal für diesen Server festlegen")
+@app_commands.describe(ausbilderleitung="Rolle der Ausbilderleitung", ausbilder="Rolle der Ausbilder")
+async def configure_staff(interaction: discord.Interaction, ausbilderleitung: discord.Role, ausbilder: discord.Role):
+    if not interaction.user.guild_permissions.manage_guild:
+        return await interaction.response.send_message("❌ Keine Berechtigung", ephemeral=True)
+
+    guild_configs.configure(interaction.guild.id, name=interaction.guild.name, staff={'ausbilderleitung': [str(ausbilderleitung.id)], 'ausbilder': [str(ausbilder.id)]})
+    await interaction.response.send_message(f"✅ Portal-Zugriff: {ausbilderleitung.mention} (Leitung), {ausbilder.mention} (Ausbilder)", ephemeral=True)
+
 @bot.event
 async def on_ready():
-    print(f'✅ Bot: {bot.user}')
+    log('ready', f'✅ Bot: {bot.user}', user=str(bot.user), guilds=len(bot.guilds))
+    migrate_legacy_guild(bot_data)
+    if not job_queue.bound:
+        persister.bind(asyncio.get_running_loop())
+        job_queue.bind(asyncio.get_running_loop(), spawn_guild_worker)
+        if job_bus is not None:
+            bot.loop.create_task(consume_job_bus())
+        bot.loop.create_task(sample_loop_lag())
+        if Config.LOOP_WATCHDOG:
+            watchdog.start(asyncio.get_running_loop())
+    if not scheduler.running:
+        bot.loop.create_task(scheduler.run())
+        bot.loop.create_task(reconcile_signups())
+    if 'gateway' not in startup.phases:
+        startup.mark('gateway')
+        await sync_commands()
+        startup.mark('sync')
+        startup.report()
+
+def command_tree_hash():
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    payload.sort(key=lambda command: command['name'])
+    return hashlib.sha256(json.dumps([bot.application_id, payload], sort_keys=True).encode('utf-8')).hexdigest()
+
+async def sync_commands():
+    """Globaler Sync ist rate-limitiert - nur ausführen, wenn sich der Command-Baum geändert hat."""
+    tree_hash = command_tree_hash()
+    if not Config.FORCE_SYNC and bot_data.get('command_hash') == tree_hash:
+        log('commands_unchanged', '✅ Commands unverändert - kein Sync')
+        return
     try:
         synced = await bot.tree.sync()
-        print(f'✅ Commands: {len(synced)}')
-        bot.loop.create_task(check_web_tasks())
+        log('commands_synced', f'✅ Commands: {len(synced)}', count=len(synced))
     except Exception as e:
-        print(f'❌ Fehler: {e}')
+        log('commands_sync_failed', f'❌ Fehler: {e}', level='error', error=str(e))
+        return
+    bot_data['command_hash'] = tree_hash
+    persister.mark_dirty()
+
+@bot.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        member_roles.invalidate(after.guild.id, after.id)
+        role_versions.bump(after.id)
+
+@bot.event
+async def on_member_remove(member):
+    member_roles.invalidate(member.guild.id, member.id)
+    role_versions.bump(member.id)
+
+async def send_web_embed(guild, msg_data):
+    channel = guild.get_channel(int(msg_data['channel_id']))
+    if not channel:
+        raise RuntimeError(f"Kanal {msg_data['channel_id']} nicht gefunden")
+
+    content = msg_data.get('content', '')
+    title = msg_data['embed']['title']
+    description = msg_data['embed']['description']
+
+    msg_type = msg_data['type']
+    pending_role = guild_objects.role(guild, guild_configs.role_id(guild.id, msg_type, 'pending'))
+    passed_role = guild_objects.role(guild, guild_configs.role_id(guild.id, msg_type, 'passed'))
+
+    content = content.replace('{pending_role}', pending_role.mention if pending_role else '@everyone')
+    content = content.replace('{passed_role}', passed_role.mention if passed_role else '✅')
+    title = title.replace('{passed_role}', passed_role.mention if passed_role else '✅')
+    description = description.replace('{passed_role}', passed_role.mention if passed_role else '✅')
+
+    now = datetime.now()
+    content = content.replace('{date}', now.strftime('%d.%m.%Y'))
+    content = content.replace('{time}', now.strftime('%H:%M'))
+    description = description.replace('{date}', now.strftime('%d.%m.%Y'))
+    description = description.replace('{time}', now.strftime('%H:%M'))
 
-async def check_web_tasks():
+    embed = discord.Embed(
+        title=title,
+        description=description,
+        color=msg_data['embed']['color']
+    )
+
+    with metrics.timer('bot_channel_send_seconds', kind='embed'):
+        await channel.send(content=content if content else None, embed=embed)
+    log('embed_sent', f"✅ Nachricht gesendet in #{channel.name}", guild_id=guild.id, channel_id=channel.id)
+
+def spawn_guild_worker(guild_id):
+    bot.loop.create_task(check_web_tasks(guild_id))
+
+async def check_web_tasks(guild_id):
+    """Worker einer Guild: arbeitet deren Jobs nacheinander ab, Guilds laufen parallel."""
     await bot.wait_until_ready()
     while not bot.is_closed():
-        try:
-            guild = bot.guilds[0] if bot.guilds else None
-            if not guild:
-                await asyncio.sleep(5)
-                continue
+        job = await job_queue.get(guild_id)
+        if not job_queue.is_pending(job['id']):
+            # Bereits erledigt (z.B. doppelt eingereiht) - nicht erneut posten
+            continue
+        guild = resolve_guild(guild_id)
+        if not guild:
+            job_queue.requeue(job, 5)
+            continue
+        await run_job(guild, job)
+
+@profiled('check_web_tasks')
+async def run_job(guild, job):
+    try:
+        if job['kind'] == 'evaluation':
+            await send_evaluation_to_channel(guild, job['data'], job['steps'], lambda: job_queue.checkpoint(job))
+        elif job['kind'] == 'embed':
+            await send_web_embed(guild, job['data'])
+        elif job['kind'] == 'scheduled':
+            await scheduler.execute(job['data'], job['steps'], lambda: job_queue.checkpoint(job))
+        job_queue.finish(job['id'])
+        metrics.inc('bot_jobs_total', kind=job['kind'], result='done')
+    except Exception as e:
+        job_queue.fail(job, e)
+        metrics.inc('bot_jobs_total', kind=job['kind'], result='failed')
 
-            # Web-Auswertungen
-            web_evals = [k for k in list(active_evaluations.keys()) if k.startswith('web_eval_')]
-            for eval_id in web_evals:
-                eval_data = active_evaluations[eval_id]
-                success = await send_evaluation_to_channel(guild, eval_data)
-                if success:
-                    del active_evaluations[eval_id]
-
-            # Nachrichten senden
-            send_tasks = [k for k in list(active_evaluations.keys()) if k.startswith('send_')]
-            for task_id in send_tasks:
-                msg_data = active_evaluations[task_id]
-                try:
-                    channel = guild.get_channel(int(msg_data['channel_id']))
-                    if not channel:
-                        del active_evaluations[task_id]
-                        continue
-
-                    content = msg_data.get('content', '')
-                    title = msg_data['embed']['title']
-                    description = msg_data['embed']['description']
-
-                    msg_type = msg_data['type']
-                    pending_role = guild.get_role(int(Config.ROLES[msg_type]['pending']))
-                    passed_role = guild.get_role(int(Config.ROLES[msg_type]['passed']))
-
-                    content = content.replace('{pending_role}', pending_role.mention if pending_role else '@everyone')
-                    content = content.replace('{passed_role}', passed_role.mention if passed_role else '✅')
-                    title = title.replace('{passed_role}', passed_role.mention if passed_role else '✅')
-                    description = description.replace('{passed_role}', passed_role.mention if passed_role else '✅')
-
-                    now = datetime.now()
-                    content = content.replace('{date}', now.strftime('%d.%m.%Y'))
-                    content = content.replace('{time}', now.strftime('%H:%M'))
-                    description = description.replace('{date}', now.strftime('%d.%m.%Y'))
-                    description = description.replace('{time}', now.strftime('%H:%M'))
-
-                    embed = discord.Embed(
-                        title=title,
-                        description=description,
-                        color=msg_data['embed']['color']
-                    )
-
-                    await channel.send(content=content if content else None, embed=embed)
-
-                    del active_evaluations[task_id]
-                    print(f"✅ Nachricht gesendet in #{channel.name}")
-                except Exception as e:
-                    print(f"❌ Fehler: {e}")
-                    del active_evaluations[task_id]
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', 1.0))
+loop_lag = {'last': 0.0}
 
+async def sample_loop_lag():
+    """Misst, wie viel später der Loop aufwacht als geplant (blockierende Handler, CPU-Last)."""
+    while not bot.is_closed():
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL)
+        loop_lag['last'] = lag
+        metrics.observe('bot_event_loop_lag_seconds', lag)
+
+metrics.gauge('bot_job_backlog', 'Wartende Jobs in der job_queue', job_queue.depth)
+metrics.gauge('bot_jobs_dead', 'Jobs in der Dead-Letter-Liste', lambda: sum(1 for job in list(job_queue.jobs.values()) if job['status'] == 'dead'))
+metrics.gauge('bot_bus_depth', 'Nachrichten im Job-Bus', lambda: job_bus.depth() if job_bus else None)
+metrics.gauge('bot_persist_pending', 'Ungespeicherte Änderungen (1 = Schreiben geplant)', lambda: int(bool(persister.stats()['pending'])))
+metrics.gauge('bot_gateway_latency_seconds', 'Heartbeat-Latenz zum Discord-Gateway (bot.latency)', lambda: bot.latency if bot.is_ready() and math.isfinite(bot.latency) else None)
+metrics.gauge('bot_event_loop_lag_last_seconds', 'Zuletzt gemessene Event-Loop-Verzögerung', lambda: loop_lag['last'] if bot.is_ready() else None)
+
+def apply_action(kind, data, key=None, guild_id=None):
+    """Führt eine Aktion des Web-Portals aus - direkt oder als Nachricht vom Job-Bus."""
+    if kind == 'embed':
+        # Erst nach der Idempotenz-Prüfung ablegen: eine Wiederholung trifft dieselbe Job-ID
+        job_id = job_queue.submit('embed', data, key=key, guild_id=guild_id)
+        job_queue.messages[job_id] = data
+        return job_id
+    if kind == 'evaluation':
+        return job_queue.submit('evaluation', data, key=key, guild_id=guild_id)
+    if kind == 'template':
+        guild_configs.set_template(guild_id, data['type'], data['template'])
+        template_versions[data['type']] = template_versions.get(data['type'], 0) + 1
+        return True
+    if kind == 'schedule':
+        return scheduler.schedule('announcement', data['due'], data['payload'], key=key)
+    if kind == 'retry':
+        return job_queue.retry(data['job_id'])
+    raise ValueError(f"Unbekannte Aktion: {kind}")
+
+BUS_POLL_INTERVAL = float(os.getenv('BUS_POLL_INTERVAL', 0.5))
+
+async def consume_job_bus():
+    """Bot-Prozess: übernimmt Aktionen des Web-Prozesses vom Job-Bus.
+
+    Bestätigt wird erst, wenn die Aktion ausgeführt und bot_data gespeichert
+    ist. Stirbt der Bot davor, liefert der Bus nach Ablauf der Lease erneut
+    aus; die Nachrichten-ID dient dann als Idempotenz-Schlüssel der job_queue
+    bzw. des Zeitplaners.
+    """
+    loop = asyncio.get_running_loop()
+    while not bot.is_closed():
+        try:
+            messages = await loop.run_in_executor(None, job_bus.claim)
+        except sqlite3.Error as e:
+            log('bus_unavailable', f"❌ Job-Bus nicht erreichbar: {e}", level='error', error=str(e))
             await asyncio.sleep(5)
-        except Exception as e:
-            print(f"❌ Task-Fehler: {e}")
-            await asyncio.sleep(10)
+            continue
+        if not messages:
+            await asyncio.sleep(BUS_POLL_INTERVAL)
+            continue
 
-if __name__ == '__main__':
-    flask_thread = Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    bot.run(Config.TOKEN)
\ No newline at end of file
+        applied = []
+        for message in messages:
+            try:
+                apply_action(message['kind'], message['data'], key=message['key'] or message['id'], guild_id=message['guild_id'])
+                applied.append(message['id'])
+            except Exception as e:
+                if message['deliveries'] >= JOB_MAX_ATTEMPTS:
+                    log('bus_message_dropped', f"☠️ Bus-Nachricht {message['id']} ({message['kind']}) verworfen: {e}", level='error', message_id=message['id'], kind=message['kind'], error=str(e))
+                    applied.append(message['id'])
+                else:
+                    log('bus_message_retry', f"🔁 Bus-Nachricht {message['id']} ({message['kind']}) fehlgeschlagen: {e}", level='warning', message_id=message['id'], kind=message['kind'], deliveries=message['deliveries'], error=str(e))
+                    await loop.run_in_executor(None, job_bus.nack, message['id'], backoff_delay(message['deliveries']))
+
+        if not await loop.run_in_executor(None, persister.flush):
+            # Nichts bestätigen, was nicht gespeichert ist: nach Ablauf der Lease
+            # kommen die Nachrichten erneut, die Schlüssel verhindern Doppelungen
+            log('bus_ack_deferred', f"⚠️ {len(applied)} Bus-Nachrichten nicht bestätigt (Speichern fehlgeschlagen)", level='warning', count=len(applied))
+            await asyncio.sleep(BUS_POLL_INTERVAL)
+            continue
+        for message_id in applied:
+            await loop.run_in_executor(None, job_bus.ack, message_id)
+
+def start_metrics_server(port):
+    """Bot-Prozess (PROCESS_ROLE=bot): /metrics ohne Flask, in einem Daemon-Thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes nicht ins Log
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    log('metrics_server', f"📈 Metriken: http://localhost:{port}/metrics", port=port)
+    return server
+
+startup.mark('setup')
+
+if __name__ == '__main__' and Config.PROCESS_ROLE == 'web':
+    # Nur das Portal; der Bot läuft als eigener Prozess (PROCESS_ROLE=bot)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    import web
+    startup.mark('web')
+    startup.report()
+    web.run_flask()
+elif __name__ == '__main__':
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    web = None
+    if Config.WEB_ENABLED and Config.PROCESS_ROLE == 'all':
+        import web
+        startup.mark('web')
+        flask_thread = Thread(target=web.run_flask, daemon=True)
+        flask_thread.start()
+    elif Config.PROCESS_ROLE == 'bot':
+        start_metrics_server(Config.METRICS_PORT)
+    try:
+        bot.run(Config.TOKEN)
+    finally:
+        if web:
+            web.stop_flask()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main lädt bot_data aus dem Arbeitsverzeichnis - die echten Daten bleiben unberührt
+os.chdir(tempfile.mkdtemp())
+
+import main  # noqa: E402
+
+LIMIT = main.DISCORD_MESSAGE_LIMIT
+MENTION = re.compile(r'<@(\d+)>')
+
+
+def utf16_units(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def make_entries(count, passed_every=3):
+    """Teilnehmer mit realistischen 18-stelligen IDs, gemischt bestanden/nicht bestanden."""
+    return [
+        {'user_id': 100000000000000000 + i, 'points': i % 26, 'grade': 1 + i % 6, 'passed': i % passed_every != 0}
+        for i in range(count)
+    ]
+
+
+class BuildEvaluationMessagesTest(unittest.TestCase):
+    def build(self, entries):
+        return main.build_evaluation_messages('stvo', entries, 25, '01.01.2026')
+
+    def test_large_evaluation_fits_discord_limit(self):
+        for count in (500, 750, 1200):
+            with self.subTest(count=count):
+                parts = self.build(make_entries(count))
+                self.assertGreater(len(parts), 1)
+                for part in parts:
+                    self.assertLessEqual(utf16_units(part), LIMIT)
+
+    def test_every_participant_appears_once_in_order(self):
+        entries = make_entries(600)
+        parts = self.build(entries)
+        mentioned = [int(m) for part in parts for m in MENTION.findall(part)]
+        expected = [e['user_id'] for e in entries if e['passed']] + [e['user_id'] for e in entries if not e['passed']]
+        self.assertEqual(mentioned, expected)
+
+    def test_parts_split_only_between_participants(self):
+        parts = self.build(make_entries(500))
+        for part in parts[1:]:
+            self.assertTrue(part.startswith(('Name: ', '**Nicht Bestanden Haben:**', 'Eure Ausbilder')), part[:40])
+        self.assertTrue(parts[0].startswith(f"⚜️ **Auswertung der {main.TRAINING_NAMES['stvo']}** ⚜️"))
+        self.assertTrue(parts[-1].endswith('@Ausbilder'))
+
+    def test_emoji_count_as_two_units(self):
+        # 🎉 liegt außerhalb der BMP: ein Zeichen in Python, zwei UTF-16-Einheiten bei Discord
+        blocks = ['🎉' * 600, 'x' * 900, '🎉' * 400]
+        parts = main.chunk_blocks(blocks)
+        for part in parts:
+            self.assertLessEqual(utf16_units(part), LIMIT)
+        self.assertEqual(''.join(parts), ''.join(blocks))
+
+    def test_oversized_block_is_split_hard(self):
+        block = 'a' * (LIMIT * 2 + 10)
+        parts = main.chunk_blocks([block])
+        self.assertEqual([len(p) for p in parts], [LIMIT, LIMIT, 10])
+
+
+if __name__ == '__main__':
+    unittest.main()
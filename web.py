@@ -0,0 +1,798 @@
+"""Dashboard (Flask) - wird von main.py nur geladen, wenn Config.WEB_ENABLED gesetzt ist."""
+import os
+import time
+import threading
+import secrets
+import hashlib
+from datetime import datetime
+from urllib.parse import urlencode
+import requests
+from flask import Flask, request, jsonify, redirect, session, url_for, make_response, g
+
+from main import (
+    Config, bot, persister, history, progression, signups, scheduler, job_queue,
+    http, get_user_info, get_user_guilds, guild_configs, member_roles, role_versions, role_from_ids, check_user_roles,
+    grading, grade_entries, iter_import_rows, template_versions, startup,
+    job_bus, replica, apply_action, log, metrics, record_guild
+)
+
+# ==================== FLASK WEB APP ====================
+class ConcurrencyLimiter:
+    """WSGI-Middleware: begrenzt gleichzeitig bearbeitete Requests, sonst 503."""
+
+    EXEMPT = ('/health', '/metrics')
+
+    def __init__(self, wsgi_app, limit, timeout):
+        self.wsgi_app = wsgi_app
+        self.timeout = timeout
+        self.resize(limit)
+
+    def resize(self, limit):
+        """Setzt das Limit neu; nur vor dem Start des Servers aufrufen."""
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') in self.EXEMPT:
+            return self.wsgi_app(environ, start_response)
+        if not self._semaphore.acquire(timeout=self.timeout):
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain; charset=utf-8'), ('Retry-After', '1')])
+            return ['Server ausgelastet, bitte erneut versuchen.'.encode('utf-8')]
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            self._semaphore.release()
+
+app = Flask(__name__)
+app.secret_key = Config.SECRET_KEY
+app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # Uploads (Massenimport)
+app.wsgi_app = ConcurrencyLimiter(app.wsgi_app, Config.WEB_MAX_CONCURRENT, Config.WEB_QUEUE_TIMEOUT)
+web_server = None
+
+# Statische Assets des Dashboards (werden mit ETag ausgeliefert)
+DASHBOARD_CSS = '''* { margin: 0; padding: 0; box-sizing: border-box; }
+body { font-family: 'Segoe UI', sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; padding: 20px; }
+.container { max-width: 1400px; margin: 0 auto; background: white; border-radius: 15px; box-shadow: 0 20px 60px rgba(0,0,0,0.3); overflow: hidden; }
+.header { background: linear-gradient(135deg, #02244b 0%, #034078 100%); color: white; padding: 30px; position: relative; }
+.header h1 { font-size: 2em; margin-bottom: 10px; }
+.user-info { position: absolute; top: 20px; right: 30px; display: flex; align-items: center; gap: 15px; }
+.avatar { width: 50px; height: 50px; border-radius: 50%; border: 3px solid white; }
+.nav { background: #f8f9fa; padding: 15px 30px; display: flex; gap: 15px; border-bottom: 2px solid #e9ecef; flex-wrap: wrap; }
+.nav button { padding: 10px 20px; border: none; background: #02244b; color: white; border-radius: 5px; cursor: pointer; transition: all 0.3s; }
+.nav button:hover { background: #034078; transform: translateY(-2px); }
+.nav button.active { background: #667eea; }
+.content { padding: 30px; }
+.login-container { max-width: 500px; margin: 100px auto; background: white; padding: 50px; border-radius: 15px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); text-align: center; }
+.login-container h2 { color: #02244b; margin-bottom: 20px; font-size: 2em; }
+.discord-btn { display: inline-block; padding: 15px 40px; background: #5865F2; color: white; text-decoration: none; border-radius: 8px; font-weight: 600; transition: all 0.3s; }
+.discord-btn:hover { background: #4752C4; transform: translateY(-2px); }
+.form-group { margin-bottom: 20px; }
+.form-group label { display: block; font-weight: 600; margin-bottom: 8px; }
+.form-group input, .form-group textarea, .form-group select { width: 100%; padding: 12px; border: 2px solid #e9ecef; border-radius: 5px; }
+.form-group textarea { min-height: 100px; resize: vertical; }
+.save-btn { padding: 15px 40px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; border-radius: 8px; font-weight: 600; cursor: pointer; transition: transform 0.3s; }
+.save-btn:hover { transform: scale(1.05); }
+.success { background: #d4edda; color: #155724; padding: 15px; border-radius: 5px; margin-bottom: 20px; }
+.error { background: #f8d7da; color: #721c24; padding: 15px; border-radius: 5px; margin-bottom: 20px; }
+.page { display: none; }
+.page.active { display: block; }
+.participant-row { display: grid; grid-template-columns: 2fr 1fr 1fr 100px; gap: 15px; margin-bottom: 15px; padding: 15px; background: #f8f9fa; border-radius: 8px; }
+.editor-container { display: grid; grid-template-columns: 1fr 400px; gap: 20px; }
+.editor-preview { background: #36393f; padding: 20px; border-radius: 10px; position: sticky; top: 20px; max-height: 80vh; overflow-y: auto; }
+.embed-preview { background: #2f3136; border-left: 4px solid; border-radius: 4px; padding: 16px; color: #dcddde; }
+.channel-selector { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin-top: 20px; }
+.channel-option { padding: 20px; background: #f8f9fa; border: 2px solid #e9ecef; border-radius: 10px; cursor: pointer; text-align: center; transition: all 0.3s; }
+.channel-option:hover, .channel-option.selected { border-color: #667eea; background: #e8eafe; }
+.list-editor { background: white; border: 2px solid #e9ecef; border-radius: 5px; padding: 15px; }
+.list-item { display: flex; gap: 10px; margin-bottom: 10px; }
+.list-item input { flex: 1; padding: 8px; border: 1px solid #dee2e6; border-radius: 3px; }
+.template-card { background: #f8f9fa; border-radius: 10px; padding: 20px; margin-bottom: 20px; border-left: 5px solid #667eea; }
+'''
+
+DASHBOARD_JS = '''function showPage(p) { document.querySelectorAll('.page').forEach(x => x.classList.remove('active')); document.querySelectorAll('.nav button').forEach(x => x.classList.remove('active')); document.getElementById('page-' + p).classList.add('active'); event.target.classList.add('active'); }
+function addListItem(c, f) { const d = document.createElement('div'); d.className = 'list-item'; d.innerHTML = '<input type="text" name="' + f + '" value=""><button type="button" onclick="this.parentElement.remove()">❌</button>'; document.getElementById(c).appendChild(d); }
+let GRADING = null;
+function loadGrading() { return GRADING ? Promise.resolve(GRADING) : fetch('/api/grading').then(r => r.json()).then(d => (GRADING = d)); }
+function maxPoints(t) { return GRADING && GRADING[t] ? GRADING[t].max_points : 50; }
+function gradeFor(t, p) { const th = GRADING[t].thresholds; let lo = 0, hi = th.length - 1; while (lo < hi) { const mid = (lo + hi) >> 1; if (th[mid].min <= p) hi = mid; else lo = mid + 1; } return th[lo].grade; }
+function autoGrade(i) { const t = document.getElementById('training-type').value; if (!t || !GRADING || i.value === '') return; i.parentElement.querySelector('input[name="grade[]"]').value = gradeFor(t, Math.min(Math.max(parseInt(i.value, 10), 0), maxPoints(t))); }
+function updateMaxPoints() { loadGrading().then(() => { const t = document.getElementById('training-type').value; const m = maxPoints(t); document.querySelectorAll('.points-input').forEach(i => { i.max = m; i.placeholder = '0-' + m; autoGrade(i); }); }); }
+function addParticipant(u) { const t = document.getElementById('training-type').value; if (!t) { alert('Typ wählen!'); return; } loadGrading().then(() => { const m = maxPoints(t); const d = document.createElement('div'); d.className = 'participant-row'; d.innerHTML = '<input type="text" name="user_id[]" placeholder="User ID" value="' + (u || '') + '" required><input type="number" name="points[]" class="points-input" min="0" max="' + m + '" placeholder="0-' + m + '" oninput="autoGrade(this)" required><input type="number" name="grade[]" min="1" max="6" placeholder="Note" required><button type="button" onclick="this.parentElement.remove()" style="padding: 10px 20px; background: #dc3545; color: white; border: none; border-radius: 5px; cursor: pointer;">❌</button>'; document.getElementById('participants-container').appendChild(d); }); }
+let SIGNUPS = [];
+function loadSignups() { fetch('/api/signups').then(r => r.json()).then(d => { SIGNUPS = d; document.getElementById('signup-select').innerHTML = '<option value="">Manuell</option>' + d.map((a, i) => '<option value="' + i + '">' + escapeHtml(STAGE_NAMES[a.type] || a.type) + ' – ' + new Date(a.timestamp * 1000).toLocaleString('de-DE') + ' (' + a.users.length + ' Anmeldungen)</option>').join(''); }); }
+function applySignups(i) { const a = SIGNUPS[i]; if (!a) return; document.getElementById('training-type').value = a.type; document.getElementById('participants-container').innerHTML = ''; a.users.forEach(u => addParticipant(u)); }
+function updatePreview() { const t = document.getElementById('embed-title').value || 'Titel'; const d = document.getElementById('embed-description').value || 'Beschreibung'; const c = document.getElementById('embed-color').value || '#667eea'; document.getElementById('live-preview').innerHTML = '<div class="embed-preview" style="border-left-color: ' + c + ';"><div style="font-size: 16px; font-weight: 600; margin-bottom: 8px;">' + t + '</div><div style="font-size: 14px;">' + d + '</div></div>'; }
+function showChannelSelector() { const f = document.getElementById('embed-form'); if (!f.checkValidity()) { f.reportValidity(); return; } document.getElementById('channel-selector-container').style.display = 'block'; }
+function selectChannel(e, t) { document.querySelectorAll('.channel-option').forEach(x => x.classList.remove('selected')); e.classList.add('selected'); document.getElementById('channel-type-input').value = t; document.getElementById('custom-channel-input').style.display = t === 'custom' ? 'block' : 'none'; }
+const STAGE_NAMES = { theorie: 'Theorie', grund: 'Grundausbildung', stvo: 'StVO', abgeschlossen: 'Abgeschlossen' };
+function escapeHtml(v) { return String(v).replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' })[c]); }
+function loadProgressionStats() { fetch('/api/progression').then(r => r.json()).then(d => { document.getElementById('progression-stats').innerHTML = '<strong>' + d.total + ' Azubis</strong><br>' + Object.entries(d.stages).map(([s, n]) => escapeHtml(STAGE_NAMES[s] || s) + ': ' + n).join(' · '); }); }
+function loadProgression() { const u = document.getElementById('progression-user').value.trim(); if (!u) return; fetch('/api/progression?user_id=' + encodeURIComponent(u)).then(r => r.ok ? r.json() : null).then(d => { const el = document.getElementById('progression-result'); if (!d) { el.innerHTML = '<div class="error">❌ Keine Auswertungen für diese ID</div>'; return; } let h = '<div class="template-card"><h3>Stufe: ' + escapeHtml(STAGE_NAMES[d.stage] || d.stage) + '</h3>'; Object.keys(d.attempts).forEach(t => { h += '<p>' + escapeHtml(STAGE_NAMES[t] || t) + ': ' + d.attempts[t] + ' Versuch(e), beste Punktzahl ' + d.best[t] + '</p>'; }); if (d.last) h += '<p>Letztes Ergebnis: ' + escapeHtml(STAGE_NAMES[d.last.type] || d.last.type) + ', ' + d.last.points + ' Punkte, Note ' + d.last.grade + (d.last.passed ? ' ✅' : ' ❌') + '</p>'; el.innerHTML = h + '</div>'; }); }
+const JOB_KINDS = { evaluation: 'Auswertung', embed: 'Nachricht', scheduled: 'Geplantes Ereignis' };
+function loadDeadLetters() { fetch('/api/dead_letters').then(r => r.json()).then(d => { const el = document.getElementById('deadletters-list'); if (!d.length) { el.innerHTML = '<div class="success">✅ Keine fehlgeschlagenen Jobs</div>'; return; } el.innerHTML = d.map(j => '<div class="template-card"><h3>' + escapeHtml(JOB_KINDS[j.kind] || j.kind) + ' <small>' + escapeHtml(j.id) + '</small></h3><p>Versuche: ' + j.attempts + ' · Erstellt: ' + escapeHtml(j.created_at || '-') + '</p><p>Erledigt: ' + escapeHtml(Object.keys(j.steps).join(', ') || '-') + '</p><div class="error">' + escapeHtml(j.last_error || '') + '</div><button type="button" class="save-btn" onclick="retryDeadLetter(\\'' + j.id + '\\')">Erneut versuchen</button></div>').join(''); }); }
+function retryDeadLetter(id) { fetch('/dead_letters/' + encodeURIComponent(id) + '/retry', { method: 'POST' }).then(() => loadDeadLetters()); }
+// Ein Schlüssel pro geladenem Formular: erneutes Absenden wird serverseitig erkannt
+document.querySelectorAll('.idempotency-key').forEach(i => { i.value = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : Date.now() + '-' + Math.random().toString(36).slice(2); });
+if (document.getElementById('page-evaluations').classList.contains('active')) loadSignups();
+['embed-title', 'embed-description', 'embed-color'].forEach(id => { const el = document.getElementById(id); if (el) el.addEventListener('input', updatePreview); });
+'''
+
+# HTML Template wird wegen Länge als separater String definiert
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html lang="de">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{% if user_role == 'ausbilderleitung' %}Ausbilderleitung{% else %}Ausbilder{% endif %} Portal</title>
+    <link rel="stylesheet" href="/assets/dashboard.css?v={{ asset_version }}">
+</head>
+<body>
+    {% if not session.get('user') %}
+    <div class="login-container">
+        <h2>🔐 Portal Login</h2>
+        <p style="color: #666; margin-bottom: 30px;">Melde dich mit Discord an</p>
+        {% if request.args.get('error') == 'no_permission' %}
+        <div class="error">❌ Du hast keine Berechtigung! Benötigte Rollen: Ausbilder oder Ausbilderleitung</div>
+        {% elif request.args.get('error') == 'no_guild' %}
+        <div class="error">❌ Bot ist keinem Server beigetreten</div>
+        {% elif request.args.get('error') == 'user_failed' %}
+        <div class="error">❌ Benutzerinformationen konnten nicht abgerufen werden</div>
+        {% elif request.args.get('error') == 'token_failed' %}
+        <div class="error">❌ Token-Austausch fehlgeschlagen</div>
+        {% elif request.args.get('error') %}
+        <div class="error">❌ Fehler: {{ request.args.get('error') }}</div>
+        {% endif %}
+        <a href="/login" class="discord-btn">Mit Discord anmelden</a>
+    </div>
+    {% else %}
+    <div class="container">
+        <div class="header">
+            <h1>{% if user_role == 'ausbilderleitung' %}Ausbilderleitungs{% else %}Ausbilder{% endif %}-Portal</h1>
+            <p>Willkommen, {{ session.user.username }}!</p>
+            <div class="user-info">
+                {% if session.user.avatar %}
+                <img src="https://cdn.discordapp.com/avatars/{{ session.user.id }}/{{ session.user.avatar }}.png" class="avatar">
+                {% endif %}
+                <div style="text-align: left;">
+                    <div style="font-weight: 600;">{{ session.user.username }}</div>
+                    <div style="font-size: 0.9em; opacity: 0.8;">{{ 'Ausbilderleitung' if user_role == 'ausbilderleitung' else 'Ausbilder' }}</div>
+                </div>
+                {% if session.guilds and session.guilds|length > 1 %}
+                <form method="POST" action="/switch_guild">
+                    <select name="guild_id" onchange="this.form.submit()" style="padding: 6px; border-radius: 5px;">
+                        {% for g in session.guilds %}<option value="{{ g.id }}" {% if g.id == session.guild_id %}selected{% endif %}>{{ g.name }}</option>{% endfor %}
+                    </select>
+                </form>
+                {% endif %}
+            </div>
+        </div>
+        <div class="nav">
+            {% if user_role == 'ausbilderleitung' %}
+            <button onclick="showPage('templates')" class="active">Templates</button>
+            <button onclick="showPage('editor')">Embed Editor</button>
+            <button onclick="showPage('deadletters'); loadDeadLetters()">Fehlgeschlagen</button>
+            {% endif %}
+            <button onclick="showPage('evaluations'); loadSignups()" {% if user_role != 'ausbilderleitung' %}class="active"{% endif %}>Auswertungen</button>
+            <button onclick="showPage('progression'); loadProgressionStats()">Fortschritt</button>
+            <button onclick="location.href='/logout'" style="margin-left: auto; background: #dc3545;">Abmelden</button>
+        </div>
+        <div class="content">
+            {% if success %}<div class="success">✅ {{ success }}</div>{% endif %}
+            {% if error %}<div class="error">❌ {{ error }}</div>{% endif %}
+
+            {% if user_role == 'ausbilderleitung' %}
+            <div class="page active" id="page-templates">
+                <h2 style="margin-bottom: 20px;">📋 Templates</h2>
+                {% for type in ['theorie', 'grund', 'stvo'] %}
+                <div class="template-card">
+                    <h3>{{ templates[type].title }}</h3>
+                    <form method="POST" action="/save/{{ type }}">
+                        <div class="form-group"><label>Titel:</label><input type="text" name="title" value="{{ templates[type].title }}" required></div>
+                        <div class="form-group"><label>Intro:</label><textarea name="intro" required>{{ templates[type].intro }}</textarea></div>
+                        <div class="form-group"><label>Themen:</label><div class="list-editor" id="topics-{{ type }}">{% for topic in templates[type].topics %}<div class="list-item"><input type="text" name="topics[]" value="{{ topic }}"><button type="button" onclick="this.parentElement.remove()">❌</button></div>{% endfor %}</div><button type="button" onclick="addListItem('topics-{{ type }}', 'topics[]')" style="padding: 8px 16px; background: #28a745; color: white; border: none; border-radius: 5px; cursor: pointer; margin-top: 10px;">+ Thema</button></div>
+                        <button type="submit" class="save-btn">Speichern</button>
+                    </form>
+                </div>
+                {% endfor %}
+                <div class="template-card">
+                    <h3>🗓️ Ankündigung planen</h3>
+                    <form method="POST" action="/schedule_announcement">
+                        <div class="form-group"><label>Typ:</label><select name="training_type" required><option value="">Wählen</option><option value="theorie">Theorie</option><option value="grund">Grund</option><option value="stvo">StVO</option></select></div>
+                        <div class="form-group"><label>Datum (TT.MM.JJJJ):</label><input type="text" name="date" required></div>
+                        <div class="form-group"><label>Uhrzeit (HH:MM):</label><input type="text" name="time" required></div>
+                        <div class="form-group"><label>Veranstalter (User ID):</label><input type="text" name="host" required></div>
+                        <div class="form-group"><label>Veröffentlichen am (TT.MM.JJJJ HH:MM, leer = sofort):</label><input type="text" name="publish_at"></div>
+                        <button type="submit" class="save-btn">Planen</button>
+                    </form>
+                </div>
+            </div>
+
+            <div class="page" id="page-editor">
+                <h2 style="margin-bottom: 20px;">✏️ Embed Editor</h2>
+                <div class="editor-container">
+                    <div>
+                        <form id="embed-form" method="POST" action="/send_embed"><input type="hidden" name="idempotency_key" class="idempotency-key">
+                            <div class="form-group"><label>Nachricht:</label><textarea name="content" id="embed-content" rows="3"></textarea></div>
+                            <div class="form-group"><label>Titel:</label><input type="text" name="title" id="embed-title" required></div>
+                            <div class="form-group"><label>Beschreibung:</label><textarea name="description" id="embed-description" rows="5" required></textarea></div>
+                            <div class="form-group"><label>Farbe (Hex):</label><input type="text" name="color" id="embed-color" value="#667eea"></div>
+                            <div class="form-group"><label>Typ:</label><select name="message_type" id="message-type"><option value="theorie">Theorie</option><option value="grund">Grund</option><option value="stvo">StVO</option></select></div>
+                            <button type="button" class="save-btn" onclick="showChannelSelector()" style="margin-right: 10px;">Senden</button>
+                            <button type="button" class="save-btn" onclick="updatePreview()" style="background: #5865f2;">Vorschau</button>
+                            <div id="channel-selector-container" style="display: none;">
+                                <div class="channel-selector">
+                                    <div class="channel-option" onclick="selectChannel(this, 'announcement')">📢 Ankündigung</div>
+                                    <div class="channel-option" onclick="selectChannel(this, 'evaluation')">📊 Auswertung</div>
+                                    <div class="channel-option" onclick="selectChannel(this, 'custom')">🎯 Custom</div>
+                                </div>
+                                <input type="hidden" name="channel_type" id="channel-type-input">
+                                <div id="custom-channel-input" style="display: none; margin-top: 15px;"><input type="text" name="custom_channel_id" placeholder="Kanal-ID" style="width: 100%; padding: 12px; border: 2px solid #e9ecef; border-radius: 5px;"></div>
+                                <button type="submit" class="save-btn" style="margin-top: 20px; width: 100%;">📤 Jetzt senden</button>
+                            </div>
+                        </form>
+                    </div>
+                    <div class="editor-preview">
+                        <h3 style="color: white; margin-bottom: 15px;">Vorschau:</h3>
+                        <div id="live-preview"><div class="embed-preview" style="border-left-color: #667eea;"><div style="font-size: 16px; font-weight: 600; margin-bottom: 8px;">Titel</div><div style="font-size: 14px;">Beschreibung</div></div></div>
+                    </div>
+                </div>
+            </div>
+
+            <div class="page" id="page-deadletters">
+                <h2 style="margin-bottom: 20px;">☠️ Fehlgeschlagene Jobs</h2>
+                <div id="deadletters-list">Lade...</div>
+                <p style="margin-top: 20px;"><a href="/api/profile">🐢 Profil langsamer Handler herunterladen</a> (nur mit LOOP_WATCHDOG)</p>
+            </div>
+            {% endif %}
+
+            <div class="page {% if user_role != 'ausbilderleitung' %}active{% endif %}" id="page-evaluations">
+                <h2 style="margin-bottom: 20px;">📊 Auswertungen</h2>
+                <form method="POST" action="/create_evaluation"><input type="hidden" name="idempotency_key" class="idempotency-key">
+                    <div class="form-group"><label>Ankündigung (übernimmt Anmeldungen):</label><select id="signup-select" onchange="applySignups(this.value)"><option value="">Manuell</option></select></div>
+                    <div class="form-group"><label>Typ:</label><select name="training_type" id="training-type" onchange="updateMaxPoints()" required><option value="">Wählen</option><option value="theorie">Theorie</option><option value="grund">Grund</option><option value="stvo">StVO</option></select></div>
+                    <div id="participants-container"></div>
+                    <button type="button" onclick="addParticipant()" style="padding: 8px 16px; background: #28a745; color: white; border: none; border-radius: 5px; cursor: pointer;">+ Teilnehmer</button>
+                    <button type="submit" class="save-btn" style="margin-top: 20px;">Senden</button>
+                </form>
+
+                <h3 style="margin: 30px 0 15px;">📥 Massenimport</h3>
+                <form method="POST" action="/import_evaluation" enctype="multipart/form-data"><input type="hidden" name="idempotency_key" class="idempotency-key">
+                    <div class="form-group"><label>Typ:</label><select name="training_type" required><option value="">Wählen</option><option value="theorie">Theorie</option><option value="grund">Grund</option><option value="stvo">StVO</option></select></div>
+                    <div class="form-group"><label>Datei (CSV mit Spalten user_id,points oder JSON-Liste):</label><input type="file" name="file" accept=".csv,.json" required></div>
+                    <p style="color: #666; margin-bottom: 15px;">Noten und Bestehen werden automatisch aus den Punkten berechnet.</p>
+                    <button type="submit" class="save-btn">Importieren</button>
+                </form>
+            </div>
+
+            <div class="page" id="page-progression">
+                <h2 style="margin-bottom: 20px;">📈 Ausbildungsfortschritt</h2>
+                <div class="template-card" id="progression-stats">Lade...</div>
+                <div class="form-group"><label>User ID:</label><input type="text" id="progression-user" placeholder="User ID"></div>
+                <button type="button" class="save-btn" onclick="loadProgression()">Anzeigen</button>
+                <div id="progression-result" style="margin-top: 20px;"></div>
+            </div>
+        </div>
+    </div>
+    <script src="/assets/dashboard.js?v={{ asset_version }}"></script>
+    {% endif %}
+</body>
+</html>'''
+
+def dispatch(kind, data, key=None, guild_id=None):
+    """Übergibt eine Aktion an den Bot: im selben Prozess direkt, sonst über den Job-Bus."""
+    if job_bus is not None:
+        return job_bus.publish(kind, data, key=key, guild_id=guild_id)
+    # bot_data wird nur im Bot-Loop verändert
+    return persister.call(apply_action, kind, data, key=key, guild_id=guild_id)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe('web_request_seconds', time.perf_counter() - started, endpoint=request.endpoint or 'unknown')
+    return response
+
+@app.before_request
+def refresh_replica():
+    # Nur im Web-Prozess: Änderungen des Bot-Prozesses übernehmen
+    if replica is not None:
+        replica.maybe_refresh()
+
+@app.before_request
+def revalidate_session():
+    user = session.get('user')
+    if not user or not session.get('user_role'):
+        return None
+    if not session.get('guild_id'):
+        # Session von vor der Multi-Guild-Umstellung: ohne Guild lässt sich nichts filtern
+        session.clear()
+        return redirect('/')
+
+    version = role_versions.get(user['id'])
+    # Der Web-Prozess hat kein Gateway, role_versions ändert sich dort nie - stattdessen nach Zeit prüfen
+    recheck = Config.PROCESS_ROLE == 'web' and time.time() - session.get('roles_checked_at', 0) >= Config.ROLE_RECHECK_INTERVAL
+    if session.get('role_version') == version and not recheck:
+        return None
+
+    # Rollen haben sich seit dem Login geändert (oder die Prüfung ist fällig) - neu bestimmen
+    guild_id = session['guild_id']
+    if recheck:
+        member_roles.invalidate(guild_id, user['id'])
+    try:
+        roles = member_roles.get_roles(guild_id, user['id'], strict=True)
+    except ConnectionError as e:
+        # Keine eindeutige Antwort (Netzwerk, 429, 5xx) - bisherigen Stand behalten, später erneut prüfen
+        log('session_recheck_failed', f"⚠️ Rollen von {user.get('username')} nicht prüfbar, Session bleibt: {e}", level='warning', user_id=user['id'], error=str(e))
+        session['roles_checked_at'] = time.time()
+        return None
+    user_role = role_from_ids(roles, guild_id) if roles is not None else None
+    if not user_role:
+        log('session_revoked', f"🔒 Session von {user.get('username')} beendet (Rollen entzogen)", user_id=user['id'])
+        session.clear()
+        return redirect('/?error=no_permission')
+
+    if user_role != session['user_role']:
+        log('session_role_changed', f"🔄 Rolle von {user.get('username')}: {session['user_role']} → {user_role}", user_id=user['id'], old=session['user_role'], new=user_role)
+    session['user_role'] = user_role
+    session['role_version'] = version
+    session['roles_checked_at'] = time.time()
+    return None
+
+# Einmal kompiliert; Autoescape wie bei render_template_string
+DASHBOARD_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+ASSETS = {
+    'dashboard.css': (DASHBOARD_CSS.encode('utf-8'), 'text/css; charset=utf-8'),
+    'dashboard.js': (DASHBOARD_JS.encode('utf-8'), 'application/javascript; charset=utf-8')
+}
+ASSET_VERSION = hashlib.sha256(DASHBOARD_CSS.encode('utf-8') + DASHBOARD_JS.encode('utf-8')).hexdigest()[:16]
+BOOT_ID = secrets.token_hex(4)
+
+def dashboard_etag(user_role=None):
+    """ETag aus allem, was die Dashboard-Seite beeinflusst."""
+    user = session.get('user') or {}
+    key = f"{BOOT_ID}:{ASSET_VERSION}:{sorted(template_versions.items())}:{user.get('id')}:{user.get('avatar')}:{session.get('guild_id')}:{user_role}:{request.query_string.decode()}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def render_dashboard(etag, **context):
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(DASHBOARD_TEMPLATE.render(session=session, request=request, asset_version=ASSET_VERSION, **context))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/assets/<name>')
+def asset(name):
+    if name not in ASSETS:
+        return 'Not Found', 404
+    body, mimetype = ASSETS[name]
+    response = make_response(body)
+    response.mimetype = mimetype
+    response.set_etag(ASSET_VERSION)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
+@app.route('/')
+def index():
+    # Prüfe ob OAuth Code in URL (Discord Redirect)
+    code = request.args.get('code')
+    if code and not session.get('user'):
+        # Weiterleitung zum Callback
+        return redirect(url_for('callback', code=code))
+
+    if not session.get('user'):
+        return render_dashboard(dashboard_etag())
+
+    user_role = session.get('user_role')
+    if not user_role:
+        return redirect('/logout')
+
+    return render_dashboard(dashboard_etag(user_role), templates=guild_configs.templates(session.get('guild_id')), user_role=user_role, success=request.args.get('success'), error=request.args.get('error'))
+
+@app.route('/login')
+def login():
+    params = {'client_id': Config.CLIENT_ID, 'redirect_uri': Config.REDIRECT_URI, 'response_type': 'code', 'scope': 'identify guilds'}
+    return redirect(f'{Config.OAUTH2_URL}?{urlencode(params)}')
+
+@app.route('/callback')
+def callback():
+    code = request.args.get('code')
+    if not code:
+        log('oauth_no_code', "❌ Kein Code erhalten", level='warning')
+        return redirect('/?error=no_code')
+
+    data = {'client_id': Config.CLIENT_ID, 'client_secret': Config.CLIENT_SECRET, 'grant_type': 'authorization_code', 'code': code, 'redirect_uri': Config.REDIRECT_URI}
+    try:
+        with metrics.timer('web_oauth_seconds', step='token'):
+            response = http.post(Config.TOKEN_URL, data=data, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    except requests.RequestException as e:
+        log('oauth_token_failed', f"❌ Token Fehler: {e}", level='error', error=str(e))
+        return redirect('/?error=token_failed')
+
+    log('oauth_token', f"📡 Token Response Status: {response.status_code}", status=response.status_code)
+
+    if response.status_code != 200:
+        log('oauth_token_failed', f"❌ Token Fehler: {response.text}", level='error', status=response.status_code)
+        return redirect('/?error=token_failed')
+
+    token_data = response.json()
+    access_token = token_data.get('access_token')
+    with metrics.timer('web_oauth_seconds', step='user'):
+        user_info = get_user_info(access_token)
+
+    if not user_info:
+        log('oauth_user_failed', "❌ User Info konnte nicht abgerufen werden", level='error')
+        return redirect('/?error=user_failed')
+
+    log('oauth_user', f"✅ User: {user_info.get('username')} (ID: {user_info.get('id')})", user_id=user_info.get('id'))
+
+    bot_guilds = {str(g.id): g.name for g in bot.guilds}
+    if not bot_guilds:
+        # Web-Prozess ohne Gateway: konfigurierte Guilds und GUILD_ID
+        bot_guilds = {guild_id: entry.get('name', guild_id) for guild_id, entry in guild_configs.guilds.items()}
+        if Config.GUILD_ID:
+            bot_guilds.setdefault(str(Config.GUILD_ID), 'Server')
+    if not bot_guilds:
+        log('login_no_guild', "❌ Keine Guild-ID verfügbar", level='error')
+        return redirect('/?error=no_guild')
+
+    with metrics.timer('web_oauth_seconds', step='guilds'):
+        guilds = accessible_guilds(user_info['id'], access_token, bot_guilds)
+    log('login_guilds', f"🏰 Zugriff auf {len(guilds)} von {len(bot_guilds)} Guilds", user_id=user_info['id'], accessible=len(guilds), total=len(bot_guilds))
+
+    if not guilds:
+        log('login_denied', f"❌ Keine Berechtigung für User {user_info.get('username')}", level='warning', user_id=user_info['id'])
+        return redirect('/?error=no_permission')
+
+    # Bevorzugt die Guild aus der Config, sonst die erste mit Portal-Rolle
+    current = next((g for g in guilds if g['id'] == str(Config.GUILD_ID)), guilds[0])
+    user_role = current['role']
+
+    session['user'] = user_info
+    session['user_role'] = user_role
+    session['role_version'] = role_versions.get(user_info['id'])
+    session['roles_checked_at'] = time.time()
+    session['guild_id'] = current['id']
+    session['guilds'] = guilds
+    session['access_token'] = access_token
+
+    log('login', f"✅ Login erfolgreich: {user_info.get('username')} als {user_role}", user_id=user_info['id'], role=user_role, guild_id=current['id'])
+    return redirect('/?success=Angemeldet!')
+
+def accessible_guilds(user_id, access_token, bot_guilds):
+    """Guilds des Bots, in denen der User eine Portal-Rolle hat.
+
+    Die Guild-Liste aus OAuth begrenzt die Rollenprüfung auf Guilds, in denen
+    der User überhaupt Mitglied ist; ohne sie werden alle Guilds geprüft.
+    """
+    user_guilds = get_user_guilds(access_token)
+    candidates = [g['id'] for g in user_guilds if g['id'] in bot_guilds] if user_guilds is not None else list(bot_guilds)
+    guilds = []
+    for guild_id in candidates:
+        role = check_user_roles(user_id, guild_id)
+        if role:
+            guilds.append({'id': guild_id, 'name': bot_guilds[guild_id], 'role': role})
+    return guilds
+
+@app.route('/switch_guild', methods=['POST'])
+def switch_guild():
+    if not session.get('user'):
+        return redirect('/')
+
+    guild_id = request.form.get('guild_id')
+    if not any(g['id'] == guild_id for g in session.get('guilds', [])):
+        return redirect('/?error=no_permission')
+    user_role = check_user_roles(session['user']['id'], guild_id)
+    if not user_role:
+        return redirect('/?error=no_permission')
+
+    session['guild_id'] = guild_id
+    session['user_role'] = user_role
+    session['role_version'] = role_versions.get(session['user']['id'])
+    session['roles_checked_at'] = time.time()
+    return redirect('/')
+
+@app.route('/logout')
+def logout():
+    session.clear()
+    return redirect('/')
+
+@app.route('/save/<type>', methods=['POST'])
+def save_template(type):
+    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
+        return redirect('/')
+
+    template = {
+        'title': request.form.get('title'),
+        'intro': request.form.get('intro'),
+        'topics': request.form.getlist('topics[]'),
+    }
+    # Felder, die das Formular nicht mitschickt, bleiben erhalten statt geleert zu werden
+    guild_id = session.get('guild_id')
+    previous = guild_configs.template(guild_id, type)
+    for field in ('additional_info', 'grading', 'benefits'):
+        key = f'{field}[]'
+        template[field] = request.form.getlist(key) if key in request.form else previous.get(field, [])
+    dispatch('template', {'type': type, 'template': template}, guild_id=guild_id)
+    return redirect('/?success=Gespeichert!')
+
+@app.route('/send_embed', methods=['POST'])
+def send_embed():
+    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
+        return redirect('/')
+
+    try:
+        content = request.form.get('content', '')
+        title = request.form.get('title')
+        description = request.form.get('description')
+        color = request.form.get('color', '#667eea').replace('#', '')
+        message_type = request.form.get('message_type')
+        channel_type = request.form.get('channel_type')
+        custom_channel_id = request.form.get('custom_channel_id', '')
+
+        if channel_type == 'custom' and custom_channel_id:
+            channel_id = custom_channel_id
+        elif channel_type in ['announcement', 'evaluation']:
+            channel_id = guild_configs.channel_id(session.get('guild_id'), message_type, channel_type)
+        else:
+            return redirect('/?error=Kein Kanal!')
+
+        embed_data = {
+            'content': content,
+            'embed': {
+                'title': title,
+                'description': description,
+                'color': int(color, 16) if color else 6736106
+            },
+            'channel_id': channel_id,
+            'type': message_type,
+            'created_at': datetime.now().isoformat()
+        }
+
+        dispatch('embed', embed_data, key=request.form.get('idempotency_key') or None, guild_id=session.get('guild_id'))
+
+        return redirect('/?success=Wird gesendet...')
+    except Exception as e:
+        return redirect(f'/?error={str(e)}')
+
+@app.route('/create_evaluation', methods=['POST'])
+def create_evaluation():
+    if not session.get('user'):
+        return redirect('/')
+
+    try:
+        guild_id = session.get('guild_id')
+        training_type = request.form.get('training_type')
+        user_ids = request.form.getlist('user_id[]')
+        points = request.form.getlist('points[]')
+
+        if not training_type or not user_ids:
+            return redirect('/?error=Felder ausfüllen!')
+        if training_type not in guild_configs.templates(guild_id):
+            return redirect('/?error=Unbekannter Ausbildungstyp!')
+
+        # Noten werden serverseitig aus den Punkten berechnet; grade[] aus dem Formular dient nur der Vorschau
+        rows = ((i, {'user_id': user_id, 'points': points[i - 1] if i <= len(points) else ''}) for i, user_id in enumerate(user_ids, 1) if user_id.strip())
+        entries, errors = grade_entries(training_type, rows, guild_id)
+        if errors:
+            more = f' (+{len(errors) - 3} weitere)' if len(errors) > 3 else ''
+            return redirect(f"/?error=Auswertung abgelehnt: {'; '.join(errors[:3])}{more}")
+        if not entries:
+            return redirect('/?error=Keine Teilnehmer!')
+
+        evaluation_data = {'training_type': training_type, 'host': int(session['user']['id']), 'entries': entries}
+
+        dispatch('evaluation', evaluation_data, key=request.form.get('idempotency_key') or None, guild_id=guild_id)
+
+        return redirect('/?success=Wird verarbeitet...')
+    except Exception as e:
+        return redirect(f'/?error={str(e)}')
+
+def parse_time_arg(value):
+    """Unix-Zeit oder TT.MM.JJJJ aus einem Query-Parameter."""
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    return int(datetime.strptime(value, '%d.%m.%Y').timestamp())
+
+@app.route('/import_evaluation', methods=['POST'])
+def import_evaluation():
+    if not session.get('user'):
+        return redirect('/')
+
+    guild_id = session.get('guild_id')
+    training_type = request.form.get('training_type')
+    upload = request.files.get('file')
+    if training_type not in guild_configs.templates(guild_id) or not upload or not upload.filename:
+        return redirect('/?error=Typ und Datei wählen!')
+
+    try:
+        entries, errors = grade_entries(training_type, iter_import_rows(upload.stream, upload.filename), guild_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        return redirect(f'/?error=Datei nicht lesbar: {e}')
+
+    if errors:
+        more = f' (+{len(errors) - 3} weitere)' if len(errors) > 3 else ''
+        return redirect(f"/?error=Import abgelehnt: {'; '.join(errors[:3])}{more}")
+    if not entries:
+        return redirect('/?error=Keine Teilnehmer!')
+
+    dispatch('evaluation', {'training_type': training_type, 'host': int(session['user']['id']), 'entries': entries}, key=request.form.get('idempotency_key') or None, guild_id=guild_id)
+    return redirect(f'/?success={len(entries)} Teilnehmer importiert, wird verarbeitet...')
+
+@app.route('/api/grading')
+def grading_api():
+    if not session.get('user'):
+        return jsonify({'error': 'unauthorized'}), 401
+    guild_id = session.get('guild_id')
+    scales = {t: grading.scale(t, guild_id) for t in guild_configs.templates(guild_id)}
+    return jsonify({t: {'max_points': sc['max_points'], 'pass_grade': 4, 'thresholds': sc['thresholds']} for t, sc in scales.items()})
+
+@app.route('/api/dead_letters')
+def dead_letters_api():
+    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify([
+        {'id': job['id'], 'kind': job['kind'], 'attempts': job.get('attempts', 0), 'last_error': job.get('last_error'), 'steps': job.get('steps', {}), 'created_at': job.get('created_at')}
+        for job in job_queue.dead_letters(session.get('guild_id'))
+    ])
+
+@app.route('/api/profile')
+def profile_api():
+    """Letzte Profile langsamer Handler und Loop-Hänger, geschrieben vom Bot-Prozess."""
+    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        with open(Config.PROFILE_FILE, encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        content = '# Keine Profile - LOOP_WATCHDOG aktiv und Schwellen überschritten?\n'
+    return content, 200, {'Content-Type': 'text/plain; charset=utf-8', 'Content-Disposition': 'attachment; filename=bot_profile.txt'}
+
+@app.route('/dead_letters/<job_id>/retry', methods=['POST'])
+def retry_dead_letter(job_id):
+    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
+        return jsonify({'error': 'unauthorized'}), 401
+    record = job_queue.jobs.get(job_id)
+    if record is None or record['status'] != 'dead' or record_guild(record) != session.get('guild_id'):
+        return jsonify({'error': 'not found'}), 404
+    dispatch('retry', {'job_id': job_id}, guild_id=session.get('guild_id'))
+    return jsonify({'status': 'pending'})
+
+@app.route('/schedule_announcement', methods=['POST'])
+def schedule_announcement():
+    if not session.get('user') or session.get('user_role') != 'ausbilderleitung':
+        return redirect('/')
+
+    try:
+        typ = request.form.get('training_type')
+        datum = request.form.get('date', '').strip()
+        uhrzeit = request.form.get('time', '').strip()
+        host = int(request.form.get('host', '').strip().strip('<@!>'))
+        timestamp = int(datetime.strptime(f"{datum} {uhrzeit}", "%d.%m.%Y %H:%M").timestamp())
+        publish_at = request.form.get('publish_at', '').strip()
+        due = int(datetime.strptime(publish_at, "%d.%m.%Y %H:%M").timestamp()) if publish_at else int(time.time())
+    except ValueError:
+        return redirect('/?error=Ungültiges Format!')
+
+    if typ not in Config.CHANNELS:
+        return redirect('/?error=Typ wählen!')
+
+    dispatch('schedule', {'due': due, 'payload': {'guild_id': session.get('guild_id'), 'type': typ, 'date': datum, 'time': uhrzeit, 'timestamp': timestamp, 'host': host}}, guild_id=session.get('guild_id'))
+    return redirect('/?success=Ankündigung geplant!')
+
+@app.route('/api/scheduled')
+def scheduled_api():
+    if not session.get('user'):
+        return jsonify({'error': 'unauthorized'}), 401
+    guild_id = str(session.get('guild_id'))
+    return jsonify([event for event in scheduler.upcoming() if str(event['payload'].get('guild_id')) == guild_id])
+
+@app.route('/api/history')
+def history_api():
+    if not session.get('user'):
+        return jsonify({'error': 'unauthorized'}), 401
+
+    collection = request.args.get('collection', 'evaluations')
+    if collection not in ('announcements', 'evaluations', 'results'):
+        return jsonify({'error': 'unknown collection'}), 400
+
+    try:
+        filters = {
+            'type': request.args.get('type') or None,
+            'host': int(request.args['host']) if request.args.get('host') else None,
+            'since': parse_time_arg(request.args.get('since')),
+            'until': parse_time_arg(request.args.get('until'))
+        }
+        if collection == 'results':
+            filters['user_id'] = int(request.args['user_id']) if request.args.get('user_id') else None
+            if request.args.get('passed') in ('true', 'false'):
+                filters['passed'] = request.args['passed'] == 'true'
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(200, max(1, int(request.args.get('per_page', 50))))
+    except ValueError:
+        return jsonify({'error': 'invalid parameter'}), 400
+
+    return jsonify(history.query(collection, page=page, per_page=per_page, guild_id=session.get('guild_id'), **filters))
+
+@app.route('/api/progression')
+def progression_api():
+    if not session.get('user'):
+        return jsonify({'error': 'unauthorized'}), 401
+
+    guild_id = session.get('guild_id')
+    user_id = request.args.get('user_id', '').strip().strip('<@!>')
+    if user_id:
+        record = progression.get(user_id, guild_id)
+        if not record:
+            return jsonify({'error': 'not found'}), 404
+        return jsonify({'user_id': user_id, **record})
+    stages = progression.stage_counts(guild_id)
+    return jsonify({'stages': stages, 'total': sum(stages.values())})
+
+@app.route('/api/signups')
+def signups_api():
+    if not session.get('user'):
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        days = float(request.args.get('days', 7))
+    except ValueError:
+        return jsonify({'error': 'invalid days'}), 400
+    return jsonify(signups.active(time.time() - days * 86400, session.get('guild_id')))
+
+@app.route('/api/stats')
+def stats():
+    if not session.get('user'):
+        return jsonify({'error': 'unauthorized'}), 401
+    # Queue-Kennzahlen nur der eigenen Guild; der Rest beschreibt den Prozess, nicht Guild-Daten
+    return jsonify({'queue': job_queue.stats(session.get('guild_id')), 'persistence': persister.stats(), 'member_cache': member_roles.stats(), 'startup': startup.phases, 'bus_depth': job_bus.depth() if job_bus else None})
+
+@app.route('/health')
+def health():
+    # Ersetzt den separaten keep_alive-Server auf Port 5000
+    return "Custom Moderation läuft!"
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def run_flask():
+    global web_server
+    port = int(os.getenv('PORT', 5000))
+    log('web_start', f"🌐 Dashboard: http://localhost:{port}", port=port)
+
+    if Config.WEB_SERVER == 'waitress':
+        try:
+            from waitress import create_server
+        except ImportError:
+            log('web_fallback', "⚠️ waitress nicht installiert - nutze Flask-Entwicklungsserver", level='warning')
+        else:
+            # waitress ruft die App nie öfter als WEB_THREADS-mal gleichzeitig auf - ein Limit
+            # darüber würde nie greifen. Weitere Verbindungen begrenzen connection_limit und backlog.
+            limit = min(Config.WEB_MAX_CONCURRENT, max(1, Config.WEB_THREADS - 1))
+            if limit != Config.WEB_MAX_CONCURRENT:
+                log('web_limit_clamped', f"⚠️ WEB_MAX_CONCURRENT={Config.WEB_MAX_CONCURRENT} wirkt mit {Config.WEB_THREADS} Threads nicht, nutze {limit}", level='warning', configured=Config.WEB_MAX_CONCURRENT, limit=limit)
+            app.wsgi_app.resize(limit)
+            web_server = create_server(app, host='0.0.0.0', port=port, threads=Config.WEB_THREADS, connection_limit=Config.WEB_CONNECTION_LIMIT, backlog=Config.WEB_BACKLOG)
+            log('web_server', f"🚀 waitress mit {Config.WEB_THREADS} Threads, {limit} gleichzeitigen Requests", threads=Config.WEB_THREADS, limit=limit, connection_limit=Config.WEB_CONNECTION_LIMIT)
+            web_server.run()
+            return
+
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+
+def stop_flask(timeout=5):
+    """Graceful Shutdown: keine neuen Verbindungen, laufende Requests abwarten."""
+    if web_server is None:
+        return
+    from waitress import wasyncore
+    # Die Sockets gehören dem Server-Thread - Schließen daher per Trigger dort ausführen
+    web_server.trigger.pull_trigger(lambda: wasyncore.dispatcher.close(web_server))
+    web_server.task_dispatcher.shutdown(cancel_pending=False, timeout=timeout)
+    web_server.trigger.pull_trigger(lambda: wasyncore.close_all(web_server._map))
+    log('web_stop', "🛑 Webserver gestoppt")